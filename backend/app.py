@@ -1,31 +1,67 @@
-from flask import Flask
+from flask import Flask, Response
 from config import Config
 from extensions import db, cors
 from routes.auth import auth_bp
 from routes.attendance import attendance_bp
 from routes.teacher import teacher_bp
 from routes.quiz import quiz_bp
+from routes.events import events_bp
+from utils.face_recognition import inference_scheduler
+from utils.inference_pool import inference_pool
+from utils.jobs import mark_jobs
+from utils.session_cache import active_session
+from utils.dashboard_state import dashboard_counters
+from utils.events import event_broker
+from utils.quiz_cache import quiz_keys
+from utils.result_writer import quiz_results_writer
+from utils.migrations import upgrade
+from utils import db_engine, query_guard, metrics
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
 
     # Initialize Extensions
+    db_engine.init_app(app)
     db.init_app(app)
     cors.init_app(app)
+    mark_jobs.init_app(app)
+    active_session.init_app(app)
+    dashboard_counters.init_app(app)
+    event_broker.init_app(app)
+    quiz_keys.init_app(app)
+    quiz_results_writer.init_app(app)
 
     # Register Blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(attendance_bp, url_prefix='/api/attendance')
     app.register_blueprint(teacher_bp, url_prefix='/api/teacher')
     app.register_blueprint(quiz_bp, url_prefix='/api/quiz')
+    app.register_blueprint(events_bp, url_prefix='/api/events')
 
     @app.route('/health')
     def health():
-        return {"status": "ok"}, 200
+        return {
+            "status": "ok",
+            "inference": inference_scheduler.stats(),
+            "inference_pool": inference_pool.stats() if inference_pool else None,
+            "database_pool": db.engine.pool.status()
+        }, 200
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        if not app.config.get('METRICS_ENABLED'):
+            return {"error": "Metrics are disabled"}, 404
+        return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
     with app.app_context():
+        db_engine.install_pragmas(db.engine, app.config) # Before the first connection is opened
+        db_engine.report(db.engine)
+        query_guard.init_app(app, db.engine)
+        metrics.init_app(app, db.engine)
         db.create_all() # Create tables if not exist
+        if app.config.get('AUTO_MIGRATE'):
+            upgrade(db.engine) # Indexes/constraints create_all can't add to existing tables; never deletes rows (see migrate.py --dedupe)
 
     return app
 
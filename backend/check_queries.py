@@ -0,0 +1,91 @@
+"""
+N+1 guard for the list endpoints.
+
+Seeds a throwaway SQLite database at two sizes and fails if any endpoint's
+query count changes with the number of rows it returns, or if its response
+does not grow with the fixture (i.e. the check would not be testing anything).
+
+Usage:
+    python check_queries.py
+"""
+import os
+import sys
+import tempfile
+
+SIZES = (5, 50)
+
+
+def main():
+    db_path = os.path.join(tempfile.mkdtemp(), "check_queries.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("ACTIVE_SESSION_STAMP_FILE", db_path + ".session")
+    os.environ.setdefault("DASHBOARD_STAMP_FILE", db_path + ".dashboard")
+
+    from datetime import datetime, timedelta
+    from app import create_app
+    from extensions import db
+    from models import User, Lecture, Attendance, Quiz, QuizResult
+    from utils import rollups
+    from utils.query_guard import assert_constant_queries, QueryCountError
+
+    app = create_app()
+    client = app.test_client()
+
+    with app.app_context():
+        quizzes, students, teachers = {}, {}, {}
+        for size in SIZES:
+            sid, tid = f"S_CHECK_{size}", f"T_CHECK_{size}"
+            db.session.add_all([
+                User(id=sid, name=f"Student {size}", role="student", password_hash="x"),
+                User(id=tid, name=f"Teacher {size}", role="teacher", password_hash="x")
+            ])
+            # Each teacher owns `size` quizzes; the first one collects `size` results
+            owned = [Quiz(teacher_id=tid, title=f"Quiz {size}/{i}", questions=[{"text": "q", "options": ["a", "b"], "correct": 0}]) for i in range(size)]
+            db.session.add_all(owned)
+            db.session.flush()
+            for i in range(size):
+                other = User(id=f"S_CHECK_{size}_{i}", name=f"Student {size}/{i}", role="student", password_hash="x")
+                lecture = Lecture(subject=f"Subject {i}", teacher_id=tid, start_time=datetime.utcnow(), is_active=False)
+                db.session.add_all([other, lecture])
+                db.session.flush()
+                db.session.add(QuizResult(quiz_id=owned[0].id, student_id=other.id, score=1, total_questions=1))
+                db.session.add(Attendance(student_id=sid, lecture_id=lecture.id, timestamp=datetime.utcnow() - timedelta(minutes=i)))
+            quizzes[size], students[size], teachers[size] = owned[0].id, sid, tid
+        db.session.commit()
+        # Attendance was inserted directly, so derive the per-subject rollups the stats endpoint reads
+        rollups.rebuild()
+
+        endpoints = [
+            ("quiz results", lambda n: f"/api/quiz/results/{quizzes[n]}"),
+            ("quiz list", lambda n: f"/api/quiz/list/{teachers[n]}"),
+            ("attendance history", lambda n: f"/api/attendance/history/{students[n]}?limit=500"),
+            ("attendance history stream", lambda n: f"/api/attendance/history/{students[n]}/stream"),
+            ("attendance stats", lambda n: f"/api/attendance/stats/{students[n]}"),
+        ]
+
+        failed = False
+        for name, url in endpoints:
+            sizes = {}
+
+            def call(size):
+                response = client.get(url(size))
+                body = response.get_data()  # Drain streamed bodies inside the counter
+                assert response.status_code == 200, f"{url(size)} -> {response.status_code}"
+                sizes[size] = len(body)
+            try:
+                counts = assert_constant_queries(db.engine, call, SIZES)
+            except QueryCountError as e:
+                failed = True
+                print(f"[QUERIES] FAIL {name}: {e}")
+                continue
+            # A response that does not grow with the fixture would pass without testing anything
+            if sizes[max(SIZES)] <= sizes[min(SIZES)]:
+                failed = True
+                print(f"[QUERIES] FAIL {name}: response does not grow with the fixture ({sizes} bytes)")
+            else:
+                print(f"[QUERIES] OK   {name}: {counts}")
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
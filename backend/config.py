@@ -2,9 +2,86 @@ import os
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'super-secret-key-change-in-production'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///attendance.db'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///attendance.db').replace('postgres://', 'postgresql://', 1)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Database engine (see utils/db_engine.py)
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')  # WAL lets readers run alongside the single writer
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')  # Safe with WAL; only the last commits can be lost on power failure
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))  # Wait for the write lock instead of "database is locked"
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT_S = int(os.environ.get('DB_POOL_TIMEOUT_S', 30))
+    DB_POOL_RECYCLE_S = int(os.environ.get('DB_POOL_RECYCLE_S', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 15000))  # Postgres only; 0 disables
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'  # Request/SQL timing and GET /metrics
+    QUERY_WARN_THRESHOLD = int(os.environ.get('QUERY_WARN_THRESHOLD', 0))  # Log requests running more queries than this (0 = off)
+    AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', '1') == '1'  # Apply pending schema migrations on startup
     
+    # Active class cache: other processes notice start/end via this file's mtime (default: instance folder)
+    ACTIVE_SESSION_STAMP_FILE = os.environ.get('ACTIVE_SESSION_STAMP_FILE')
+    DASHBOARD_STAMP_FILE = os.environ.get('DASHBOARD_STAMP_FILE')  # Same idea for the dashboard counters
+    QUIZ_STAMP_FILE = os.environ.get('QUIZ_STAMP_FILE')  # ...and for compiled quiz answer keys
+
+    # Concurrent quiz submissions share one batched insert (0 = insert each one on its own)
+    QUIZ_WRITE_BEHIND = os.environ.get('QUIZ_WRITE_BEHIND', '1') == '1'
+    QUIZ_FLUSH_INTERVAL_MS = 50   # Submits wait for their batch, so this adds to their latency
+    QUIZ_FLUSH_MAX_ROWS = 200
+    QUIZ_FLUSH_TIMEOUT_S = 10     # Give up (503) if a batch can't be written, e.g. database down
+
+    # Server-Sent Events
+    EVENT_BUFFER_SIZE = 100   # Per-subscriber backlog before old events are dropped
+    EVENT_KEEPALIVE_S = 15
+    EVENT_REFRESH_S = 2       # How often streams check for changes made by other worker processes
+
     # Face Recognition Config
     FACES_DIR = os.path.join(os.getcwd(), 'faces')
     CAMPUS_LOCATION = {"latitude": 34.0522, "longitude": -118.2437, "radius_km": 0.5} # Example: LA
+
+    # Uploaded frames are decoded/downscaled so the longest side is at most this
+    IMAGE_MAX_SIDE = int(os.environ.get('IMAGE_MAX_SIDE', 1280))
+
+    # Face detection
+    FACE_DETECTOR_BACKEND = os.environ.get('FACE_DETECTOR_BACKEND', 'retinaface')  # Any DeepFace backend: retinaface, mtcnn, ssd, opencv, yunet...
+    FACE_PRECHECK = os.environ.get('FACE_PRECHECK', 'haar')  # Cheap OpenCV presence check before the detector: 'haar', 'yunet' or 'none' (falls back to 'none' if unavailable)
+    FACE_PRECHECK_MODEL = os.environ.get('FACE_PRECHECK_MODEL', '')  # Path to the YuNet .onnx file when FACE_PRECHECK='yunet'
+    FACE_PRECHECK_MAX_SIDE = 320     # Frames are downscaled to this for the precheck
+    FACE_PRECHECK_MIN_CONTRAST = 8   # Grayscale std-dev below this is treated as a blank/dark frame
+    FACE_PRECHECK_CROP = True        # Pass only the region around candidate faces to the detector
+
+    # Face templates
+    FACE_MODEL_NAME = "ArcFace"
+    FACE_MODEL_VERSION = "deepface"
+    EMBEDDING_STORAGE_DTYPE = os.environ.get('EMBEDDING_STORAGE_DTYPE', 'float32')  # or 'float16' for half-size rows
+    MAX_TEMPLATES_PER_USER = 10
+
+    # Inference micro-batching: concurrent frames share one ArcFace forward pass
+    INFERENCE_BATCHING = os.environ.get('INFERENCE_BATCHING', '1') == '1'
+    INFERENCE_BATCH_WINDOW_MS = int(os.environ.get('INFERENCE_BATCH_WINDOW_MS', 10))
+    INFERENCE_BATCH_MAX_SIZE = int(os.environ.get('INFERENCE_BATCH_MAX_SIZE', 16))
+    INFERENCE_TIMEOUT_S = 30
+
+    # Out-of-process inference: 0 runs models in the web process
+    INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 0))
+    INFERENCE_SHM_BYTES = int(os.environ.get('INFERENCE_SHM_BYTES', 32 * 1024 * 1024))  # Frame buffer per worker
+
+    # Async /mark jobs
+    ASYNC_MARK_WORKERS = int(os.environ.get('ASYNC_MARK_WORKERS', 8))
+    JOB_TTL_S = 600       # Finished jobs are kept this long for status polling
+    JOB_MAX_WAIT_S = 25   # Upper bound for long-poll ?wait=
+
+    # 1:N Identification (kiosk mode)
+    IDENTIFY_TOP_K = 5
+    IDENTIFY_MAX_TOP_K = 20       # ?top_k= is clamped to 1..this (the IVF search fetches top_k * MAX_TEMPLATES_PER_USER rows)
+    ANN_MIN_GALLERY_SIZE = 10000  # Switch from brute force to the IVF index at this many enrolled faces
+    ANN_NPROBE = 8                # IVF clusters scanned per query (higher = more accurate, slower)
+
+    # Attendance history
+    HISTORY_PAGE_SIZE = 50        # Default ?limit= for /attendance/history
+    HISTORY_MAX_PAGE_SIZE = 500
+    HISTORY_STREAM_CHUNK = 500    # Rows fetched per round trip by /history/<id>/stream
+
+    # Bulk export
+    EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 5000))  # Rows per cursor fetch / CSV chunk / Parquet row group
@@ -0,0 +1,152 @@
+"""
+Bulk face enrollment.
+
+Walks <faces_dir>/<student_id>/*.jpg|jpeg|png, embeds every new image in a
+process pool and stores the templates in batched transactions. Images are
+identified by content hash, so re-running after an interruption (or after
+adding photos) only processes files that have not been seen before.
+
+Usage:
+    python enroll_bulk.py [faces_dir] [--workers 4] [--batch-size 200] [--retry-failed]
+"""
+import argparse
+import hashlib
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def _init_worker():
+    # Load RetinaFace/ArcFace once per worker process
+    from utils.face_recognition import FaceModel
+    FaceModel()
+
+
+def _embed_file(path):
+    from utils.face_recognition import get_embedding
+    try:
+        return path, get_embedding(path), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def find_images(faces_dir):
+    """Yield (student_id, path) for every reference image under faces_dir."""
+    for sid in sorted(os.listdir(faces_dir)):
+        folder = os.path.join(faces_dir, sid)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield sid, os.path.join(folder, name)
+
+
+def main():
+    from app import create_app
+    from config import Config
+    from extensions import db
+    from models import User, FaceEmbedding, EnrollmentFile
+
+    parser = argparse.ArgumentParser(description="Enroll reference face images in bulk.")
+    parser.add_argument("faces_dir", nargs="?", default=Config.FACES_DIR)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--batch-size", type=int, default=200, help="Templates written per DB transaction")
+    parser.add_argument("--retry-failed", action="store_true", help="Re-process images where no face was found before")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.faces_dir):
+        print(f"[ENROLL] Faces directory not found: {args.faces_dir}")
+        return
+
+    app = create_app()
+    with app.app_context():
+        known_users = {uid for (uid,) in db.session.query(User.id)}
+        query = db.session.query(EnrollmentFile.content_hash)
+        if args.retry_failed:
+            query = query.filter(EnrollmentFile.embedding_id.isnot(None))
+        seen = {h for (h,) in query}
+
+        # 1. Collect work, skipping unknown students and already-processed content
+        todo, skipped, failures = {}, 0, []
+        for sid, path in find_images(args.faces_dir):
+            if sid not in known_users:
+                failures.append((path, f"unknown user {sid}"))
+                continue
+            digest = file_hash(path)
+            if digest in seen or digest in todo:
+                skipped += 1
+                continue
+            todo[digest] = (sid, path)
+
+        print(f"[ENROLL] {len(todo)} new images, {skipped} already processed, using {args.workers} workers")
+        if not todo:
+            _report(0, skipped, failures, 0.0)
+            return
+
+        by_path = {path: (digest, sid) for digest, (sid, path) in todo.items()}
+        enrolled, pending = 0, []
+        start = time.time()
+
+        def flush():
+            # One transaction per batch: templates first so their ids can be recorded
+            templates = [FaceEmbedding.from_array(
+                sid, emb,
+                dtype=Config.EMBEDDING_STORAGE_DTYPE,
+                model_name=Config.FACE_MODEL_NAME,
+                model_version=Config.FACE_MODEL_VERSION
+            ) if emb else None for _, sid, _, emb in pending]
+            db.session.add_all([t for t in templates if t])
+            db.session.flush()
+            for (digest, sid, path, _), template in zip(pending, templates):
+                db.session.merge(EnrollmentFile(
+                    content_hash=digest,
+                    user_id=sid,
+                    path=path,
+                    embedding_id=template.id if template else None
+                ))
+            db.session.commit()
+            pending.clear()
+
+        # 2. Embed in a process pool ('spawn': TensorFlow is not fork-safe)
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=mp.get_context("spawn"), initializer=_init_worker) as pool:
+            futures = [pool.submit(_embed_file, path) for path in by_path]
+            for i, future in enumerate(as_completed(futures), 1):
+                path, embedding, error = future.result()
+                digest, sid = by_path[path]
+                if embedding:
+                    enrolled += 1
+                else:
+                    failures.append((path, error or "no face detected"))
+                pending.append((digest, sid, path, embedding))
+
+                if len(pending) >= args.batch_size:
+                    flush()
+                if i % 100 == 0:
+                    elapsed = time.time() - start
+                    print(f"[ENROLL] {i}/{len(futures)} images ({i / elapsed:.1f}/s)")
+
+        if pending:
+            flush()
+        _report(enrolled, skipped, failures, time.time() - start)
+
+
+def _report(enrolled, skipped, failures, elapsed):
+    rate = enrolled / elapsed if elapsed else 0
+    print(f"[ENROLL] Enrolled {enrolled} images in {elapsed:.1f}s ({rate:.1f}/s), skipped {skipped}, failed {len(failures)}")
+    for path, reason in failures:
+        print(f"[ENROLL]   FAILED {path}: {reason}")
+
+
+if __name__ == "__main__":
+    main()
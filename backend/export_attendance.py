@@ -0,0 +1,69 @@
+"""
+Export attendance for reports (same data as GET /api/teacher/export).
+
+Usage:
+    python export_attendance.py [-o report.csv] [--format csv|parquet]
+                                [--from 2025-01-06] [--to 2025-05-30]
+                                [--subject Math] [--teacher T01]
+
+CSV goes to stdout when no output file is given.
+"""
+import argparse
+import contextlib
+import sys
+import time
+
+
+def main():
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="Stream attendance to CSV or Parquet.")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout, CSV only)")
+    parser.add_argument("--format", choices=["csv", "parquet"], help="Defaults to the output file extension, else csv")
+    parser.add_argument("--from", dest="start", help="First day (ISO date)")
+    parser.add_argument("--to", dest="end", help="Last day, inclusive (ISO date)")
+    parser.add_argument("--subject")
+    parser.add_argument("--teacher", help="Teacher id")
+    parser.add_argument("--chunk-size", type=int, default=Config.EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format or ("parquet" if args.output and args.output.endswith(".parquet") else "csv")
+    if fmt == "parquet" and not args.output:
+        parser.error("Parquet output needs -o/--output")
+
+    # Startup logging must not end up in a CSV written to stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        from app import create_app
+        from extensions import db
+        from utils.export import export_chunks, parse_date, ExportError
+        app = create_app()
+    with app.app_context():
+        try:
+            chunks = export_chunks(
+                db.engine, fmt, args.chunk_size,
+                start=parse_date(args.start),
+                end=parse_date(args.end, end=True),
+                subject=args.subject,
+                teacher_id=args.teacher
+            )
+        except ExportError as e:
+            print(f"[EXPORT] {e}", file=sys.stderr)
+            sys.exit(1)
+
+        start = time.time()
+        written = 0
+        if args.output:
+            mode, encoding = ("w", "utf-8") if fmt == "csv" else ("wb", None)
+            with open(args.output, mode, encoding=encoding, newline="" if fmt == "csv" else None) as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+                written += len(chunk)
+        print(f"[EXPORT] Wrote {written / 1e6:.1f} MB of {fmt} in {time.time() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,4 +3,5 @@ from flask_cors import CORS
 
 db = SQLAlchemy()
 # Allow all origins, methods, and headers. Support credentials.
-cors = CORS(resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+# Response headers the frontend must be able to read cross-origin (history pagination).
+cors = CORS(resources={r"/*": {"origins": "*"}}, supports_credentials=True, expose_headers=["X-Next-Cursor"])
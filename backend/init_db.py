@@ -1,8 +1,8 @@
 from app import create_app
 from extensions import db
-from models import User
+from models import User, FaceEmbedding
+from config import Config
 from utils.face_recognition import get_embedding
-import json
 import os
 
 app = create_app()
@@ -12,7 +12,13 @@ def enroll_user(user_id, image_path):
         print(f"Generating embedding for {user_id}...")
         embedding = get_embedding(image_path)
         if embedding:
-            return json.dumps(embedding)
+            return FaceEmbedding.from_array(
+                user_id,
+                embedding,
+                dtype=Config.EMBEDDING_STORAGE_DTYPE,
+                model_name=Config.FACE_MODEL_NAME,
+                model_version=Config.FACE_MODEL_VERSION
+            )
         else:
             print(f"Failed to generate embedding for {image_path}")
     else:
@@ -0,0 +1,55 @@
+"""
+Schema migrations.
+
+Applies pending steps from utils/migrations.py and can EXPLAIN the hot
+queries to confirm they hit their indexes. Steps that would delete
+duplicate rows stop with a description of them; rerun with --dedupe to
+keep the earliest row of each key and delete the rest.
+
+Usage:
+    python migrate.py [--status] [--check] [--dedupe]
+"""
+import argparse
+import os
+import sys
+
+
+def main():
+    # Migrations run below with this script's flags, not during create_app()
+    os.environ["AUTO_MIGRATE"] = "0"
+    from app import create_app
+    from extensions import db
+    from utils.migrations import upgrade, status, check_query_plans, MigrationError
+
+    parser = argparse.ArgumentParser(description="Apply schema migrations.")
+    parser.add_argument("--status", action="store_true", help="List migrations and whether they are applied")
+    parser.add_argument("--check", action="store_true", help="EXPLAIN the hot queries; exit 1 if one misses its index")
+    parser.add_argument("--dedupe", action="store_true", help="Delete duplicate rows that block a unique index (keeps the earliest)")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.status:
+            for version, name, applied in status(db.engine):
+                print(f"[MIGRATE] {version:03d} {name:<30} {'applied' if applied else 'PENDING'}")
+            return
+
+        try:
+            applied = upgrade(db.engine, dedupe=args.dedupe)
+        except MigrationError as e:
+            print(f"[MIGRATE] {e}")
+            sys.exit(1)
+        print(f"[MIGRATE] Applied {len(applied)} migration(s)" if applied else "[MIGRATE] Schema is up to date")
+
+        if args.check:
+            missed = 0
+            for description, index, ok, plan in check_query_plans(db.engine):
+                print(f"[MIGRATE] {'OK  ' if ok else 'MISS'} {description} -> {index}")
+                if not ok:
+                    missed += 1
+                    print("[MIGRATE]      " + plan.replace("\n", "\n[MIGRATE]      "))
+            sys.exit(1 if missed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from datetime import datetime
+import numpy as np
 from extensions import db
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -10,7 +11,7 @@ class User(db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # 'student', 'teacher'
     profile_image = db.Column(db.Text, nullable=True)  # Base64 or path
-    face_encoding = db.Column(db.Text, nullable=True) # JSON string of embedding
+    face_encoding = db.Column(db.Text, nullable=True) # Legacy JSON embedding, superseded by FaceEmbedding
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def set_password(self, password):
@@ -28,8 +29,59 @@ class User(db.Model):
             "profile_image": self.profile_image
         }
 
+class FaceEmbedding(db.Model):
+    __tablename__ = 'face_embeddings'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(50), db.ForeignKey('users.id'), nullable=False, index=True)
+    vector = db.Column(db.LargeBinary, nullable=False) # Raw float32/float16 bytes
+    dtype = db.Column(db.String(10), nullable=False, default="float32")
+    dim = db.Column(db.Integer, nullable=False)
+    model_name = db.Column(db.String(50), nullable=False, default="ArcFace")
+    model_version = db.Column(db.String(20), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    user = db.relationship('User', backref='face_embeddings')
+
+    @classmethod
+    def from_array(cls, user_id, embedding, dtype="float32", model_name="ArcFace", model_version=None):
+        arr = np.asarray(embedding, dtype=dtype)
+        return cls(
+            user_id=user_id,
+            vector=arr.tobytes(),
+            dtype=dtype,
+            dim=arr.shape[0],
+            model_name=model_name,
+            model_version=model_version
+        )
+
+    def to_array(self):
+        return np.frombuffer(self.vector, dtype=self.dtype).astype(np.float32)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "model_name": self.model_name,
+            "model_version": self.model_version,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+
+class EnrollmentFile(db.Model):
+    """Reference images already processed by enroll_bulk.py, keyed by content hash."""
+    __tablename__ = 'enrollment_files'
+    content_hash = db.Column(db.String(64), primary_key=True) # sha256 hex
+    user_id = db.Column(db.String(50), db.ForeignKey('users.id'), nullable=False)
+    path = db.Column(db.String(500), nullable=False)
+    embedding_id = db.Column(db.Integer, db.ForeignKey('face_embeddings.id'), nullable=True) # None if no face was found
+    processed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Lecture(db.Model):
     __tablename__ = 'lectures'
+    __table_args__ = (
+        db.Index('ix_lectures_is_active', 'is_active'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     subject = db.Column(db.String(100), nullable=False)
     teacher_id = db.Column(db.String(50), db.ForeignKey('users.id'), nullable=False)
@@ -50,6 +102,12 @@ class Lecture(db.Model):
 
 class Attendance(db.Model):
     __tablename__ = 'attendance'
+    __table_args__ = (
+        # One row per student per lecture; also serves the duplicate check
+        db.Index('uq_attendance_student_lecture', 'student_id', 'lecture_id', unique=True),
+        db.Index('ix_attendance_student_timestamp', 'student_id', 'timestamp'),
+        db.Index('ix_attendance_timestamp', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.String(50), db.ForeignKey('users.id'), nullable=False)
     lecture_id = db.Column(db.Integer, db.ForeignKey('lectures.id'), nullable=True)
@@ -65,17 +123,40 @@ class Attendance(db.Model):
     student = db.relationship('User', backref='attendance_records')
     lecture = db.relationship('Lecture', backref='attendance_records')
 
-    def to_dict(self):
+    def to_dict(self, student_name=None):
+        # Pass student_name when serializing many rows to skip the per-row User load
+        if student_name is None:
+            student_name = self.student.name if self.student else "Unknown"
         return {
             "id": self.id,
             "student_id": self.student_id,
-            "student_name": self.student.name if self.student else "Unknown",
+            "student_name": student_name,
             "timestamp": self.timestamp.isoformat(),
             "status": self.status,
             "distance": self.distance,
             "gps": {"lat": self.gps_lat, "lon": self.gps_lon}
         }
 
+class AttendanceRollup(db.Model):
+    """Per-student, per-subject attendance counts, kept in step with Attendance by utils/rollups.py."""
+    __tablename__ = 'attendance_rollups'
+    student_id = db.Column(db.String(50), db.ForeignKey('users.id'), primary_key=True)
+    subject = db.Column(db.String(100), primary_key=True)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    last_seen = db.Column(db.DateTime, nullable=True)  # Latest Present/Late timestamp
+
+    def to_dict(self):
+        return {
+            "name": self.subject,
+            "attendance": self.present + self.late + self.absent,
+            "present": self.present,
+            "late": self.late,
+            "absent": self.absent,
+            "last_seen": self.last_seen.isoformat() if self.last_seen else None
+        }
+
 class Announcement(db.Model):
     __tablename__ = 'announcements'
     id = db.Column(db.Integer, primary_key=True)
@@ -95,6 +176,9 @@ class Announcement(db.Model):
 
 class Quiz(db.Model):
     __tablename__ = 'quizzes'
+    __table_args__ = (
+        db.Index('ix_quizzes_teacher_created', 'teacher_id', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     teacher_id = db.Column(db.String(50), db.ForeignKey('users.id'), nullable=False)
     title = db.Column(db.String(100), nullable=False)
@@ -112,11 +196,16 @@ class Quiz(db.Model):
 
 class QuizResult(db.Model):
     __tablename__ = 'quiz_results'
+    __table_args__ = (
+        # One result per student per quiz; also serves the duplicate check
+        db.Index('uq_quiz_results_quiz_student', 'quiz_id', 'student_id', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False)
     student_id = db.Column(db.String(50), db.ForeignKey('users.id'), nullable=False)
     score = db.Column(db.Integer, nullable=False)
     total_questions = db.Column(db.Integer, nullable=False)
+    answers = db.Column(db.LargeBinary, nullable=True)  # int8 option index per question, -1 = unanswered (see AnswerKey.pack)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
     student = db.relationship('User', backref='quiz_results')
@@ -0,0 +1,25 @@
+"""
+Recompute the attendance_rollups table from the raw attendance rows.
+
+Needed after backfills/imports that write attendance without going through
+the API. Runs in one transaction, so readers see the old or new rollups.
+
+Usage:
+    python rebuild_rollups.py
+"""
+import time
+
+
+def main():
+    from app import create_app
+    from utils.rollups import rebuild
+
+    app = create_app()
+    with app.app_context():
+        start = time.time()
+        count = rebuild()
+        print(f"[ROLLUP] Rebuilt {count} student/subject rollups in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
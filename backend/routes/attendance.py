@@ -1,9 +1,20 @@
+import base64
 import math
-from flask import Blueprint, request, jsonify
-from datetime import datetime
-from models import Attendance, User, Lecture
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from datetime import datetime, timedelta
+from models import Attendance, AttendanceRollup, User, FaceEmbedding
 from extensions import db
-from utils.face_recognition import verify_face_logic, decode_base64_to_cv2_image, get_embedding
+from sqlalchemy.exc import IntegrityError
+from utils.face_recognition import verify_face_logic, decode_image_payload, get_embedding, identify_face_logic, embed_faces, COSINE_THRESHOLD
+from scipy.optimize import linear_sum_assignment
+import numpy as np
+from utils.face_gallery import face_gallery, enroll_template
+from utils.jobs import mark_jobs
+from utils.session_cache import active_session
+from utils.dashboard_state import dashboard_counters
+from utils.events import event_broker
+from utils.metrics import face_stage
+from utils.rollups import apply_attendance
 from config import Config
 import cv2
 import os
@@ -22,21 +33,139 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     return R * c
 
+def read_upload():
+    """
+    Return (fields, image payload) for JSON, multipart/form-data or raw image bodies.
+    JSON carries a base64 data URL in "image"; multipart sends an "image" file part;
+    a raw image/jpeg (or octet-stream) body takes its fields from the query string.
+    Binary uploads are passed on as bytes and never go through base64.
+    """
+    if request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream':
+        return request.args.to_dict(), request.get_data(cache=False)
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('image')
+        return request.form.to_dict(), upload.read() if upload else None
+    data = request.get_json(silent=True) or {}
+    return data, data.get('image')
+
+def is_truthy(value):
+    # Form and query fields arrive as strings
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+def to_float(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+def attendance_status(lecture, now):
+    # 5. Determine Status (Present vs Late)
+    # Grace period: 5 minutes
+    if now - lecture.start_time > timedelta(minutes=5):
+        return "Late"
+    return "Present"
+
+def publish_attendance(row, student_name=None):
+    # Carries today's present count so dashboards update without refetching
+    _, present_today, _ = dashboard_counters.snapshot()
+    event_broker.publish("attendance", {
+        "id": row.id,
+        "student_id": row.student_id,
+        "student_name": student_name,
+        "lecture_id": row.lecture_id,
+        "status": row.status,
+        "confidence": row.confidence,
+        "timestamp": row.timestamp.isoformat(),
+        "total_attendance": present_today
+    })
+
+def record_attendance(student_id, lecture, confidence, lat=None, lon=None, distance=0, student_name=None):
+    """Insert an Attendance row for a verified student and return its status."""
+    now = datetime.utcnow()
+    status = attendance_status(lecture, now)
+
+    new_attendance = Attendance(
+        student_id=student_id,
+        lecture_id=lecture.id,
+        status=status,
+        confidence=confidence,
+        gps_lat=lat,
+        gps_lon=lon,
+        distance=distance,
+        timestamp=now
+    )
+    db.session.add(new_attendance)
+    try:
+        # Same transaction as the insert, so the rollup can't drift from the raw rows
+        apply_attendance(student_id, lecture.subject, status, now)
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request for the same student + lecture won the unique index
+        db.session.rollback()
+        existing = Attendance.query.filter_by(student_id=student_id, lecture_id=lecture.id).first()
+        return existing.status if existing else status
+    dashboard_counters.record_attendance(student_id, now)
+    publish_attendance(new_attendance, student_name)
+    return status
+
+def verify_and_record(student_id, active_lecture, image_data, lat, lon, distance):
+    """
+    Steps 4-5 of marking: decode, verify the face and insert the Attendance row.
+    Returns (response body, HTTP status) so it can run inline or as a background job.
+    """
+    # 4. Face Recognition Logic
+    user = User.query.get(student_id)
+    if not user:
+        return {"error": "User not found"}, 404
+
+    img = decode_image_payload(image_data)
+    if img is None:
+        return {"error": "Invalid image data"}, 400
+
+    # Optimization: Process in-memory without disk write
+    try:
+        # Auto-enrollment logic
+        face_gallery.ensure_loaded()
+        if user.id not in face_gallery:
+            face_gallery.load_user(user.id)
+        if user.id not in face_gallery:
+            # DeepFace accepts numpy array
+            embedding = get_embedding(img)
+            if embedding:
+                enroll_template(user.id, embedding)
+            else:
+                return {"error": "Could not detect face for enrollment."}, 400
+
+        result = verify_face_logic(img, user)
+    except Exception as e:
+        return {"error": f"Face verification failed: {str(e)}"}, 500
+
+    if result['status'] != 'success':
+        return {"error": result['message']}, 400
+
+    status = record_attendance(student_id, active_lecture, result.get('confidence', 0), lat, lon, distance, student_name=user.name)
+    return {
+        "message": f"Attendance Marked! Status: {status}", 
+        "status": status,
+        "confidence": result.get('confidence')
+    }, 200
+
 @attendance_bp.route('/mark', methods=['POST'])
 def mark_attendance():
     print("DEBUG: Received attendance request")
     try:
-        data = request.json
+        data, image_data = read_upload()
         student_id = data.get('student_id')
-        image_data = data.get('image')
-        lat = data.get('latitude')
-        lon = data.get('longitude')
+        lat = to_float(data.get('latitude'))
+        lon = to_float(data.get('longitude'))
 
         if not all([student_id, image_data]):
              return jsonify({"error": "Missing student_id or image"}), 400
 
         # 1. Strict Session Check
-        active_lecture = Lecture.query.filter_by(is_active=True).first()
+        active_lecture = active_session.get()
         if not active_lecture:
              return jsonify({"error": "No class session is currently active. Attendance cannot be marked."}), 400
 
@@ -61,82 +190,303 @@ def mark_attendance():
             campus_lon = Config.CAMPUS_LOCATION["longitude"]
             distance = calculate_distance(lat, lon, campus_lat, campus_lon)
 
-        # 4. Face Recognition Logic
-        user = User.query.get(student_id)
-        if not user:
-            return jsonify({"error": "User not found"}), 404
+        # Async mode: queue the slow face pipeline and answer 202 with a job id.
+        # Repeat submissions for the same student + lecture join the pending job.
+        if is_truthy(data.get('async')) or request.args.get('async') == '1':
+            job, created = mark_jobs.submit(
+                (student_id, active_lecture.id),
+                verify_and_record, student_id, active_lecture, image_data, lat, lon, distance
+            )
+            body = job.to_dict()
+            body["status_url"] = f"/api/attendance/mark/status/{job.id}"
+            body["duplicate"] = not created
+            return jsonify(body), 202
 
-        img = decode_base64_to_cv2_image(image_data)
-        if img is None:
-            return jsonify({"error": "Invalid image data"}), 400
-        
+        body, code = verify_and_record(student_id, active_lecture, image_data, lat, lon, distance)
+        return jsonify(body), code
+
+    except Exception as e:
+        print(f"DEBUG: Critical Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@attendance_bp.route('/mark/status/<job_id>', methods=['GET'])
+def mark_status(job_id):
+    """Poll an async /mark job. ?wait=N long-polls up to N seconds for the result."""
+    try:
+        wait = float(request.args.get('wait') or 0)
+    except ValueError:
+        wait = math.nan
+    if not math.isfinite(wait):
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    wait = min(max(wait, 0.0), Config.JOB_MAX_WAIT_S)
+    job = mark_jobs.get(job_id, wait=wait)
+    if not job:
+        return jsonify({"error": "Job not found or expired"}), 404
+    return jsonify(job.to_dict()), 200 if job.done.is_set() else 202
+
+@attendance_bp.route('/mark/group', methods=['POST'])
+def mark_group_attendance():
+    """
+    Mark a whole class from one wide photo: embed every face in a single
+    batch, score them against all enrolled students in one similarity
+    matrix and assign identities one-to-one (no student matched twice).
+    """
+    try:
+        data, image_data = read_upload()
+        if not image_data:
+            return jsonify({"error": "Missing image"}), 400
+
+        active_lecture = active_session.get()
+        if not active_lecture:
+            return jsonify({"error": "No class session is currently active. Attendance cannot be marked."}), 400
+
+        img = decode_image_payload(image_data)
         if img is None:
             return jsonify({"error": "Invalid image data"}), 400
-        
-        # Optimization: Process in-memory without disk write
-        try:
-            # Auto-enrollment logic
-            if not user.face_encoding:
-                # DeepFace accepts numpy array
-                embedding = get_embedding(img)
-                if embedding:
-                    user.face_encoding = json.dumps(embedding)
-                    db.session.commit()
-                else:
-                    return jsonify({"error": "Could not detect face for enrollment."}), 400
 
-            result = verify_face_logic(img, user)
-        except Exception as e:
-            return jsonify({"error": f"Face verification failed: {str(e)}"}), 500
-        
-        # No finally block needed as no file to clean up
-
-        if result['status'] == 'success':
-            # 5. Determine Status (Present vs Late)
-            # Grace period: 5 minutes
-            now = datetime.utcnow()
-            start_time = active_lecture.start_time
-            time_diff = now - start_time
-            
-            status = "Present"
-            if time_diff > datetime.timedelta(minutes=5):
-                status = "Late"
-
-            new_attendance = Attendance(
+        faces = embed_faces(img)
+        if not faces:
+            return jsonify({"error": "No faces detected in the photo."}), 400
+
+        # Roster: every enrolled student (lectures have no enrollment list yet)
+        face_gallery.ensure_loaded()
+        with face_stage.time("compare"):
+            user_ids, scores = face_gallery.similarities([f["embedding"] for f in faces])
+        students = {uid for (uid,) in db.session.query(User.id).filter_by(role='student')}
+        roster = [i for i, uid in enumerate(user_ids) if uid in students]
+        if not roster:
+            return jsonify({"error": "No enrolled students to match against."}), 400
+        scores = scores[:, roster]
+
+        # One-to-one assignment maximising total similarity
+        with face_stage.time("assign"):
+            rows, cols = linear_sum_assignment(np.where(np.isfinite(scores), scores, -1.0), maximize=True)
+
+        already = {sid for (sid,) in db.session.query(Attendance.student_id).filter_by(lecture_id=active_lecture.id)}
+        now = datetime.utcnow()
+        status = attendance_status(active_lecture, now)
+        marked, skipped, new_rows = [], [], []
+        for r, c in zip(rows, cols):
+            score = float(scores[r, c])
+            if 1 - score >= COSINE_THRESHOLD:
+                continue
+            student_id = user_ids[roster[c]]
+            if student_id in already:
+                skipped.append(student_id)
+                continue
+            new_rows.append(Attendance(
                 student_id=student_id,
                 lecture_id=active_lecture.id,
                 status=status,
-                confidence=result.get('confidence', 0),
-                gps_lat=lat,
-                gps_lon=lon,
-                distance=distance,
+                confidence=score * 100,
                 timestamp=now
-            )
-            db.session.add(new_attendance)
+            ))
+            marked.append({"student_id": student_id, "confidence": score * 100, "facial_area": faces[r]["facial_area"]})
+
+        # Single bulk insert for the whole class
+        db.session.add_all(new_rows)
+        try:
+            for row in new_rows:
+                apply_attendance(row.student_id, active_lecture.subject, status, now)
             db.session.commit()
-            
-            return jsonify({
-                "message": f"Attendance Marked! Status: {status}", 
-                "status": status,
-                "confidence": result.get('confidence')
-            }), 200
-        else:
-            return jsonify({"error": result['message']}), 400
+        except IntegrityError:
+            # Someone checked in individually meanwhile; insert row by row and skip those
+            db.session.rollback()
+            inserted = []
+            for row in new_rows:
+                db.session.add(row)
+                try:
+                    apply_attendance(row.student_id, active_lecture.subject, status, now)
+                    db.session.commit()
+                    inserted.append(row)
+                except IntegrityError:
+                    db.session.rollback()
+                    skipped.append(row.student_id)
+            marked = [m for m in marked if m["student_id"] not in skipped]
+            new_rows = inserted
+        names = dict(db.session.query(User.id, User.name).filter(User.id.in_([r.student_id for r in new_rows]))) if new_rows else {}
+        for row in new_rows:
+            dashboard_counters.record_attendance(row.student_id, now)
+            publish_attendance(row, names.get(row.student_id))
+
+        return jsonify({
+            "message": f"Marked {len(marked)} students from {len(faces)} faces",
+            "faces_detected": len(faces),
+            "marked": marked,
+            "already_marked": skipped,
+            "unmatched_faces": len(faces) - len(marked) - len(skipped),
+            "status": status
+        }), 200
 
     except Exception as e:
-        print(f"DEBUG: Critical Error: {e}")
+        print(f"DEBUG: Group Attendance Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@attendance_bp.route('/enroll', methods=['POST'])
+def enroll_face():
+    """Add another face template for a student (up to Config.MAX_TEMPLATES_PER_USER)."""
+    try:
+        data, image_data = read_upload()
+        student_id = data.get('student_id')
+
+        if not all([student_id, image_data]):
+            return jsonify({"error": "Missing student_id or image"}), 400
+
+        user = User.query.get(student_id)
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+
+        count = FaceEmbedding.query.filter_by(user_id=student_id).count()
+        if count >= Config.MAX_TEMPLATES_PER_USER:
+            return jsonify({"error": f"Maximum of {Config.MAX_TEMPLATES_PER_USER} face templates reached"}), 400
+
+        img = decode_image_payload(image_data)
+        if img is None:
+            return jsonify({"error": "Invalid image data"}), 400
+
+        embedding = get_embedding(img)
+        if not embedding:
+            return jsonify({"error": "Could not detect face for enrollment."}), 400
+
+        face_gallery.ensure_loaded()
+        template = enroll_template(student_id, embedding)
+        return jsonify({"message": "Face enrolled", "template": template.to_dict(), "templates": count + 1}), 201
+
+    except Exception as e:
+        print(f"DEBUG: Enrollment Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def encode_cursor(row):
+    return base64.urlsafe_b64encode(f"{row.timestamp.isoformat()}|{row.id}".encode()).decode()
+
+def decode_cursor(cursor):
+    timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(timestamp), int(row_id)
+
+def history_query(student_id):
+    """
+    Newest-first attendance for a student, narrowed by ?from= / ?to= (ISO dates, inclusive).
+    Ordered by (timestamp, id) so it walks ix_attendance_student_timestamp and pages are stable.
+    Raises ValueError on a malformed date.
+    """
+    query = Attendance.query.filter(Attendance.student_id == student_id)
+    if request.args.get('from'):
+        query = query.filter(Attendance.timestamp >= datetime.fromisoformat(request.args['from']))
+    if request.args.get('to'):
+        end = datetime.fromisoformat(request.args['to'])
+        if len(request.args['to']) == 10:
+            end += timedelta(days=1)  # A bare date includes that whole day
+        query = query.filter(Attendance.timestamp < end)
+    return query.order_by(Attendance.timestamp.desc(), Attendance.id.desc())
+
+def student_name(student_id):
+    return db.session.query(User.name).filter(User.id == student_id).scalar() or "Unknown"
+
 @attendance_bp.route('/history/<student_id>', methods=['GET'])
 def get_history(student_id):
-    records = Attendance.query.filter_by(student_id=student_id).order_by(Attendance.timestamp.desc()).all()
-    return jsonify([r.to_dict() for r in records])
+    """
+    One page of history. ?limit= caps the page size, ?cursor= continues from the
+    previous page; the next cursor is returned in the X-Next-Cursor header (absent on the last page).
+    """
+    try:
+        limit = min(int(request.args.get('limit', Config.HISTORY_PAGE_SIZE)), Config.HISTORY_MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        query = history_query(student_id)
+        if request.args.get('cursor'):
+            ts, row_id = decode_cursor(request.args['cursor'])
+            # Keyset seek: strictly older than the last row of the previous page
+            query = query.filter(db.or_(
+                Attendance.timestamp < ts,
+                db.and_(Attendance.timestamp == ts, Attendance.id < row_id)
+            ))
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid pagination parameters: {e}"}), 400
+
+    records = query.limit(limit + 1).all()
+    has_more = len(records) > limit
+    records = records[:limit]
+
+    name = student_name(student_id)
+    response = jsonify([r.to_dict(name) for r in records])
+    if has_more:
+        response.headers['X-Next-Cursor'] = encode_cursor(records[-1])
+    return response
+
+@attendance_bp.route('/history/<student_id>/stream', methods=['GET'])
+def stream_history(student_id):
+    """Full (optionally date-filtered) history as JSON lines, fetched in chunks instead of one .all()."""
+    try:
+        query = history_query(student_id)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid date filter: {e}"}), 400
+
+    name = student_name(student_id)
+
+    def generate():
+        for row in query.yield_per(Config.HISTORY_STREAM_CHUNK):
+            yield json.dumps(row.to_dict(name)) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @attendance_bp.route('/stats/<student_id>', methods=['GET'])
 def get_student_stats(student_id):
-    results = db.session.query(
-        Lecture.subject, 
-        db.func.count(Attendance.id)
-    ).join(Attendance).filter(Attendance.student_id == student_id).group_by(Lecture.subject).all()
-    stats = [{"name": r[0], "attendance": r[1]} for r in results]
-    return jsonify(stats)
+    # One row per subject from the rollup table instead of aggregating the whole history
+    rollups = AttendanceRollup.query.filter_by(student_id=student_id).order_by(AttendanceRollup.subject).all()
+    return jsonify([r.to_dict() for r in rollups])
+
+@attendance_bp.route('/identify', methods=['POST'])
+def identify_student():
+    """
+    Kiosk mode: identify who is in the frame (1:N) instead of verifying a claimed student_id.
+    Marks attendance for the best match when a class is active, unless "mark" is false.
+    """
+    try:
+        data, image_data = read_upload()
+        try:
+            top_k = int(data.get('top_k') or Config.IDENTIFY_TOP_K)
+        except (TypeError, ValueError):
+            return jsonify({"error": "top_k must be an integer"}), 400
+        top_k = min(max(top_k, 1), Config.IDENTIFY_MAX_TOP_K)
+        should_mark = is_truthy(data.get('mark', True))
+
+        if not image_data:
+            return jsonify({"error": "Missing image"}), 400
+
+        img = decode_image_payload(image_data)
+        if img is None:
+            return jsonify({"error": "Invalid image data"}), 400
+
+        result = identify_face_logic(img, top_k=top_k)
+        if result['status'] == 'error':
+            return jsonify({"error": result['message']}), 400
+
+        response = {"match": None, "candidates": result['candidates']}
+        if result['status'] != 'success':
+            response["message"] = result['message']
+            return jsonify(response), 200
+
+        student_id = result['student_id']
+        user = User.query.get(student_id)
+        response["match"] = {
+            "student_id": student_id,
+            "student_name": user.name if user else "Unknown",
+            "confidence": result['confidence']
+        }
+
+        active_lecture = active_session.get()
+        if should_mark and active_lecture:
+            existing = Attendance.query.filter_by(student_id=student_id, lecture_id=active_lecture.id).first()
+            if existing:
+                response["message"] = "Attendance already marked for this session"
+                response["status"] = existing.status
+            else:
+                status = record_attendance(student_id, active_lecture, result['confidence'], student_name=user.name if user else None)
+                response["message"] = f"Attendance Marked! Status: {status}"
+                response["status"] = status
+
+        return jsonify(response), 200
+
+    except Exception as e:
+        print(f"DEBUG: Identification Error: {e}")
+        return jsonify({"error": str(e)}), 500
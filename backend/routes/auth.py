@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from models import User
 from extensions import db
+from utils.dashboard_state import dashboard_counters
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -36,5 +37,7 @@ def register():
     new_user.set_password(data.get('password'))
     db.session.add(new_user)
     db.session.commit()
+    if new_user.role == 'student':
+        dashboard_counters.student_added()
     
     return jsonify({"message": "User created"}), 201
@@ -0,0 +1,56 @@
+from flask import Blueprint, Response, current_app, request, jsonify
+from utils.events import event_broker, format_event
+from utils.session_cache import active_session
+from utils.dashboard_state import dashboard_counters
+
+events_bp = Blueprint('events', __name__)
+
+TOPICS = ("class_started", "class_ended", "attendance", "announcement", "quiz_activated", "quiz_stopped")
+
+
+def _snapshot():
+    lecture = active_session.get()
+    total_students, present_today, _ = dashboard_counters.snapshot()
+    return {
+        "active_class": lecture.subject if lecture else None,
+        "active_lecture_id": lecture.id if lecture else None,
+        "total_students": total_students,
+        "total_attendance": present_today
+    }
+
+
+@events_bp.route('/stream', methods=['GET'])
+def stream():
+    """
+    Server-Sent Events: class_started, class_ended, attendance, announcement,
+    quiz_activated, quiz_stopped. Replaces the 5s polling of the dashboard pages.
+    ?topics=a,b subscribes to those events only (the snapshot is always sent).
+    A new snapshot is sent when another process changes the active class or
+    the attendance counters.
+    """
+    topics = None
+    if request.args.get('topics'):
+        topics = {t.strip() for t in request.args['topics'].split(',') if t.strip()}
+        unknown = topics.difference(TOPICS)
+        if unknown:
+            return jsonify({"error": f"Unknown topics: {', '.join(sorted(unknown))}"}), 400
+
+    # Current state once on connect; later changes come from the broker or refresh()
+    last = _snapshot()
+    app = current_app._get_current_object()
+
+    def refresh():
+        # Broker events only come from this process. Both caches check their
+        # stamp files, so changes made by other workers show up here too.
+        nonlocal last
+        with app.app_context():
+            current = _snapshot()
+        if current == last:
+            return None
+        last = current
+        return format_event("snapshot", current)
+
+    return Response(event_broker.stream(format_event("snapshot", last), topics, refresh), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Disable proxy buffering (nginx)
+    })
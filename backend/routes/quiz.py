@@ -2,6 +2,10 @@ from flask import Blueprint, request, jsonify
 from extensions import db
 from models import Quiz, QuizResult, User, Lecture
 from datetime import datetime
+from utils.events import event_broker
+from utils.quiz_cache import quiz_keys
+from utils.result_writer import quiz_results_writer, STORED, DUPLICATE
+from utils.quiz_analytics import quiz_analytics
 
 quiz_bp = Blueprint('quiz', __name__)
 
@@ -23,6 +27,7 @@ def create_quiz():
     )
     db.session.add(new_quiz)
     db.session.commit()
+    event_broker.publish("quiz_activated", {"quiz_id": new_quiz.id, "title": new_quiz.title})
     return jsonify({"message": "Quiz created successfully", "quiz_id": new_quiz.id}), 201
 
 @quiz_bp.route('/active', methods=['GET'])
@@ -43,44 +48,39 @@ def submit_quiz():
     if not all([quiz_id, student_id, answers]):
         return jsonify({"error": "Missing data"}), 400
 
-    # 1. Check if already submitted
-    existing = QuizResult.query.filter_by(quiz_id=quiz_id, student_id=student_id).first()
-    if existing:
+    # 1. Compiled answer key from the in-memory cache (no quiz body read)
+    # Questions structure: [{"text": "...", "options": ["A", "B"], "correct": 0}]
+    key = quiz_keys.get(quiz_id)
+    if key is None:
+        return jsonify({"error": "Quiz not found"}), 404
+
+    # 2. Check if already submitted (in-memory set; the unique index decides across processes)
+    if not quiz_results_writer.claim(key.quiz_id, student_id):
         return jsonify({"error": "You have already submitted this quiz"}), 400
 
-    # 2. Calculate Score
-    quiz = Quiz.query.get(quiz_id)
-    if not quiz:
-        return jsonify({"error": "Quiz not found"}), 404
+    # 3. Calculate Score
+    score = key.score(answers)
+    total = key.total
 
-    score = 0
-    total = len(quiz.questions)
-    
-    # Simple evaluation (assuming 'correct' index in question)
-    # Questions structure: [{"text": "...", "options": ["A", "B"], "correct": 0}]
-    for i, q in enumerate(quiz.questions):
-        str_i = str(i)
-        user_answer = None
-        
-        # Handle if answers is list or dict
-        if isinstance(answers, list) and i < len(answers):
-             user_answer = answers[i]
-        elif isinstance(answers, dict) and str_i in answers:
-             user_answer = answers[str_i]
-             
-        if user_answer is not None:
-            # Check if answer matches correct index
-            if user_answer == q.get('correct'):
-                score += 1
-    
-    result = QuizResult(
-        quiz_id=quiz_id,
-        student_id=student_id,
-        score=score,
-        total_questions=total
-    )
-    db.session.add(result)
-    db.session.commit()
+    # 4. Written together with concurrent submissions in one batched insert
+    try:
+        outcome = quiz_results_writer.submit({
+            "quiz_id": key.quiz_id,
+            "student_id": student_id,
+            "score": score,
+            "total_questions": total,
+            "answers": key.pack(answers),
+            "timestamp": datetime.utcnow()
+        })
+    except TimeoutError:
+        quiz_results_writer.release(key.quiz_id, student_id)
+        return jsonify({"error": "Could not save your submission, please try again"}), 503
+    if outcome == DUPLICATE:
+        return jsonify({"error": "You have already submitted this quiz"}), 400
+    if outcome != STORED:
+        # Quiz deleted meanwhile, or the student does not exist
+        quiz_results_writer.release(key.quiz_id, student_id)
+        return jsonify({"error": "Quiz or student not found"}), 404
 
     return jsonify({
         "message": "Quiz submitted",
@@ -94,6 +94,8 @@ def stop_quiz(quiz_id):
     if quiz:
         quiz.is_active = False
         db.session.commit()
+        quiz_keys.invalidate(quiz.id)
+        event_broker.publish("quiz_stopped", {"quiz_id": quiz.id})
         return jsonify({"message": "Quiz stopped"}), 200
     return jsonify({"error": "Quiz not found"}), 404
 
@@ -115,21 +117,36 @@ def delete_quiz(quiz_id):
         return jsonify({"error": "Quiz not found"}), 404
     
     # Optional: Delete associated results first if cascading delete isn't set up
+    quiz_results_writer.forget_quiz(quiz_id)
+    quiz_analytics.forget(quiz_id)
     QuizResult.query.filter_by(quiz_id=quiz_id).delete()
     
     db.session.delete(quiz)
     db.session.commit()
+    quiz_keys.invalidate(quiz_id)
     return jsonify({"message": "Quiz deleted successfully"}), 200
 
 @quiz_bp.route('/results/<int:quiz_id>', methods=['GET'])
 def get_results(quiz_id):
-    results = QuizResult.query.filter_by(quiz_id=quiz_id).all()
-    data = []
-    for r in results:
-        student = User.query.get(r.student_id)
-        data.append({
-            "student_name": student.name if student else "Unknown",
-            "score": r.score,
-            "total": r.total_questions
-        })
-    return jsonify(data)
+    quiz_results_writer.flush()  # Include submissions still waiting in the write buffer
+    # One joined projection instead of a User lookup per result row
+    rows = db.session.query(User.name, QuizResult.score, QuizResult.total_questions) \
+        .select_from(QuizResult) \
+        .outerjoin(User, User.id == QuizResult.student_id) \
+        .filter(QuizResult.quiz_id == quiz_id) \
+        .order_by(QuizResult.id) \
+        .all()
+    return jsonify([{
+        "student_name": name or "Unknown",
+        "score": score,
+        "total": total
+    } for name, score, total in rows])
+
+@quiz_bp.route('/analytics/<int:quiz_id>', methods=['GET'])
+def get_analytics(quiz_id):
+    """Item analysis: per-question correct rate, option frequencies, discrimination and score distribution."""
+    quiz_results_writer.flush()
+    key = quiz_keys.get(quiz_id)
+    if key is None:
+        return jsonify({"error": "Quiz not found"}), 404
+    return jsonify(quiz_analytics.get(key))
@@ -1,31 +1,42 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response, Response, stream_with_context
 from models import User, Attendance, Quiz, QuizResult, Announcement, LeaveRequest, Lecture
 from extensions import db
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
+from utils.session_cache import active_session
+from utils.dashboard_state import dashboard_counters
+from utils.events import event_broker
+from utils.rollups import apply_attendance, refresh_last_seen, STATUS_COLUMNS, SEEN_STATUSES
+from utils.export import export_chunks, parse_date, FORMATS, ExportError
+from config import Config
 
 teacher_bp = Blueprint('teacher', __name__)
 
 @teacher_bp.route('/dashboard', methods=['GET'])
 def dashboard():
-    # 1. Total Students
-    total_students = User.query.filter_by(role='student').count()
-    
-    # 2. Present Today (Unique students who marked attendance today)
-    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    present_today = db.session.query(
-        db.func.count(db.func.distinct(Attendance.student_id))
-    ).filter(Attendance.timestamp >= today_start).scalar() or 0
+    # 1. Total Students + 2. Present Today (unique students today), kept as
+    # incremental counters instead of COUNT queries on every poll
+    total_students, present_today, state_version = dashboard_counters.snapshot()
 
     # 3. Active Class
-    active_lecture = Lecture.query.filter_by(is_active=True).first()
-    
-    return jsonify({
+    active_lecture = active_session.get()
+
+    # Polling clients revalidate with If-None-Match and get a bodiless 304 while nothing changed
+    etag = f"{state_version}-{active_lecture.id if active_lecture else 0}"
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    response = jsonify({
         "total_students": total_students,
         "total_attendance": present_today, # Renamed to match UI expectation of "Present Today"
         "active_class": active_lecture.subject if active_lecture else None,
         "active_lecture_id": active_lecture.id if active_lecture else None
     })
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @teacher_bp.route('/class/status', methods=['POST'])
 def toggle_class_status():
@@ -47,11 +58,20 @@ def toggle_class_status():
         )
         db.session.add(lecture)
         db.session.commit()
+        active_session.set(lecture)
+        event_broker.publish("class_started", {
+            "lecture_id": lecture.id,
+            "subject": lecture.subject,
+            "teacher_id": lecture.teacher_id,
+            "start_time": lecture.start_time.isoformat()
+        })
         return jsonify({"message": f"Class started: {subject}", "status": "active"}), 200
         
     elif action == 'end':
         Lecture.query.filter_by(is_active=True).update({"is_active": False, "end_time": datetime.utcnow()})
         db.session.commit()
+        active_session.set(None)
+        event_broker.publish("class_ended", {})
         return jsonify({"message": "Class ended", "status": "inactive"}), 200
         
     return jsonify({"error": "Invalid action"}), 400
@@ -65,9 +85,84 @@ def create_announcement():
     )
     db.session.add(new_announcement)
     db.session.commit()
+    event_broker.publish("announcement", {
+        "id": new_announcement.id,
+        "teacher_id": new_announcement.teacher_id,
+        "message": new_announcement.message,
+        "timestamp": new_announcement.timestamp.isoformat()
+    })
     return jsonify({"message": "Announcement sent"}), 201
 
 @teacher_bp.route('/update_attendance', methods=['POST'])
 def update_attendance():
-    # Logic to update attendance manually
-    return jsonify({"message": "Attendance updated"}), 200
+    """
+    Manual correction: set the status of an attendance row, identified by
+    "attendance_id" or by "student_id" + "lecture_id" (a missing row is created,
+    e.g. to mark someone Absent or present by hand).
+    """
+    data = request.json or {}
+    status = data.get('status')
+    if status not in STATUS_COLUMNS:
+        return jsonify({"error": f"status must be one of: {', '.join(STATUS_COLUMNS)}"}), 400
+
+    if data.get('attendance_id'):
+        record = Attendance.query.get(data['attendance_id'])
+        if not record:
+            return jsonify({"error": "Attendance record not found"}), 404
+        lecture = Lecture.query.get(record.lecture_id) if record.lecture_id else None
+    else:
+        student_id, lecture_id = data.get('student_id'), data.get('lecture_id')
+        if not student_id or not lecture_id:
+            return jsonify({"error": "Provide attendance_id, or student_id and lecture_id"}), 400
+        lecture = Lecture.query.get(lecture_id)
+        if not lecture or not User.query.get(student_id):
+            return jsonify({"error": "Student or lecture not found"}), 404
+        record = Attendance.query.filter_by(student_id=student_id, lecture_id=lecture_id).first()
+
+    subject = lecture.subject if lecture else None
+    created = record is None
+    try:
+        if created:
+            record = Attendance(student_id=data['student_id'], lecture_id=lecture.id, status=status, timestamp=datetime.utcnow())
+            db.session.add(record)
+            apply_attendance(record.student_id, subject, status, record.timestamp)
+        elif record.status != status:
+            old_status, record.status = record.status, status
+            # Move the row between rollup columns in the same transaction
+            apply_attendance(record.student_id, subject, old_status, record.timestamp, delta=-1)
+            apply_attendance(record.student_id, subject, status, record.timestamp)
+            if old_status in SEEN_STATUSES and status not in SEEN_STATUSES and subject:
+                refresh_last_seen(record.student_id, subject)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "Attendance was recorded concurrently, retry the update"}), 409
+
+    if created:
+        dashboard_counters.record_attendance(record.student_id, record.timestamp)
+    return jsonify({"message": "Attendance updated", "attendance": record.to_dict()}), 201 if created else 200
+
+@teacher_bp.route('/export', methods=['GET'])
+def export_attendance():
+    """
+    Stream attendance joined with students and lectures as CSV (default) or Parquet.
+    Filters: ?from= / ?to= (ISO dates, inclusive), ?subject=, ?teacher_id=
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    try:
+        chunks = export_chunks(
+            db.engine, fmt, Config.EXPORT_CHUNK_SIZE,
+            start=parse_date(request.args.get('from')),
+            end=parse_date(request.args.get('to'), end=True),
+            subject=request.args.get('subject'),
+            teacher_id=request.args.get('teacher_id')
+        )
+    except ExportError as e:
+        return jsonify({"error": str(e)}), 400
+
+    mimetype, extension = FORMATS[fmt]
+    filename = f"attendance_{datetime.utcnow():%Y%m%d_%H%M%S}.{extension}"
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Accel-Buffering": "no"  # Let nginx pass chunks through as they are produced
+    })
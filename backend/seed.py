@@ -9,6 +9,8 @@ import numpy as np
 import cv2
 from deepface import DeepFace
 
+from enroll_bulk import file_hash  # Same content hash as bulk enrollment
+
 app = Flask(__name__)
 CORS(app)
 
@@ -54,6 +56,10 @@ for cand in ["faces", "student_face", "student_faces"]:
         break
 
 REFERENCE_FACES = {}
+REFERENCE_EMBEDDINGS = {}  # sid -> (paths, L2-normalised float32 matrix)
+
+EMBEDDING_CACHE_FILE = ".embedding_cache.npz"
+ARCFACE_COSINE_THRESHOLD = 0.68  # DeepFace.verify default for ArcFace + cosine
 
 def load_reference_faces():
     global REFERENCE_FACES
@@ -81,6 +87,71 @@ def load_reference_faces():
             REFERENCE_FACES[sid] = files
             print(f"[FACE] Loaded {len(files)} images for {sid}")
 
+    build_embedding_cache(base)
+
+def build_embedding_cache(base):
+    """
+    Embed every reference image once and keep the vectors on disk next to the
+    faces folder. A cached vector is reused while the file's mtime and size
+    are unchanged, or if its content hash still matches after a touch/copy.
+    """
+    global REFERENCE_EMBEDDINGS
+    REFERENCE_EMBEDDINGS = {}
+    cache_path = os.path.join(base, EMBEDDING_CACHE_FILE)
+
+    cached = {}
+    if os.path.exists(cache_path):
+        try:
+            with np.load(cache_path, allow_pickle=False) as data:
+                for path, mtime, size, digest, vec in zip(data["paths"], data["mtimes"], data["sizes"], data["hashes"], data["vectors"]):
+                    cached[str(path)] = (float(mtime), int(size), str(digest), vec)
+        except Exception as e:
+            print("[FACE] Ignoring unreadable embedding cache:", e)
+
+    entries = {}
+    computed = 0
+    for sid, files in REFERENCE_FACES.items():
+        for path in files:
+            st = os.stat(path)
+            hit = cached.get(path)
+            if hit and hit[0] == st.st_mtime and hit[1] == st.st_size:
+                entries[path] = hit
+                continue
+            digest = file_hash(path)
+            if hit and hit[2] == digest:
+                entries[path] = (st.st_mtime, st.st_size, digest, hit[3])
+                continue
+            try:
+                rep = DeepFace.represent(
+                    img_path=path,
+                    model_name="ArcFace",
+                    detector_backend="retinaface",
+                    enforce_detection=False
+                )
+                entries[path] = (st.st_mtime, st.st_size, digest, np.asarray(rep[0]["embedding"], dtype=np.float32))
+                computed += 1
+            except Exception as e:
+                print(f"[FACE] Could not embed {path}:", e)
+
+    for sid, files in REFERENCE_FACES.items():
+        paths = [p for p in files if p in entries]
+        if paths:
+            mat = np.stack([entries[p][3] for p in paths]).astype(np.float32)
+            mat /= np.maximum(np.linalg.norm(mat, axis=1, keepdims=True), 1e-12)
+            REFERENCE_EMBEDDINGS[sid] = (paths, mat)
+
+    if entries:
+        paths = list(entries)
+        np.savez(
+            cache_path,
+            paths=np.array(paths),
+            mtimes=np.array([entries[p][0] for p in paths]),
+            sizes=np.array([entries[p][1] for p in paths]),
+            hashes=np.array([entries[p][2] for p in paths]),
+            vectors=np.stack([entries[p][3] for p in paths])
+        )
+    print(f"[FACE] Embedding cache: {len(entries) - computed} reused, {computed} computed")
+
 load_reference_faces()
 
 # -------------------------
@@ -125,11 +196,12 @@ def verify_face(student_id: str, image_data_url: str):
 
     # -------- 1. FACE DETECTION (mandatory) --------
     try:
-        # Extract faces with confidence
+        # Extract faces with confidence (+ liveness)
         detected_faces = DeepFace.extract_faces(
             img_path=live_rgb,
             detector_backend="retinaface",
-            enforce_detection=True
+            enforce_detection=True,
+            anti_spoofing=True
         )
 
         if len(detected_faces) == 0:
@@ -147,36 +219,38 @@ def verify_face(student_id: str, image_data_url: str):
         print("[FACE] No face detected:", e)
         return False, None, "No face detected"
 
-    # -------- 2. VERIFY AGAINST STORED IMAGES --------
-    potential_spoof = False
-    
-    for ref in REFERENCE_FACES[student_id]:
-        try:
-            result = DeepFace.verify(
-                live_rgb,
-                ref,
-                model_name="ArcFace",
-                detector_backend="retinaface",
-                anti_spoofing=True,
-                enforce_detection=False
-            )
-
-            verified = result.get("verified", False)
-            is_real = result.get("is_real", True)  # anti-spoofing
-            dist = result.get("distance")
-
-            print(f"[FACE] Compare {student_id} with {ref}: verified={verified}, real={is_real}, dist={dist}")
-
-            if verified:
-                if is_real:
-                    return True, result, None
-                else:
-                    potential_spoof = True
+    # -------- 2. VERIFY AGAINST CACHED REFERENCE EMBEDDINGS --------
+    # Embed the detected face once (no second detection) and compare it
+    # with all of the student's precomputed references in one product.
+    if student_id not in REFERENCE_EMBEDDINGS:
+        return False, None, f"No usable reference images for {student_id}"
 
-        except Exception as e:
-            print("[FACE] DeepFace error:", e)
+    try:
+        face = detected_faces[0]["face"]  # aligned RGB crop in [0, 1]
+        face_bgr = (face[:, :, ::-1] * 255).astype(np.uint8)
+        rep = DeepFace.represent(
+            img_path=face_bgr,
+            model_name="ArcFace",
+            detector_backend="skip"
+        )
+        live_vec = np.asarray(rep[0]["embedding"], dtype=np.float32)
+        live_vec /= max(np.linalg.norm(live_vec), 1e-12)
+    except Exception as e:
+        print("[FACE] DeepFace error:", e)
+        return False, None, "Face not matched"
+
+    paths, refs = REFERENCE_EMBEDDINGS[student_id]
+    dists = 1.0 - refs @ live_vec
+    best = int(np.argmin(dists))
+    dist = float(dists[best])
+    verified = dist <= ARCFACE_COSINE_THRESHOLD
+    is_real = detected_faces[0].get("is_real", True)  # anti-spoofing
+
+    print(f"[FACE] Compare {student_id} with {paths[best]}: verified={verified}, real={is_real}, dist={dist}")
 
-    if potential_spoof:
+    if verified:
+        if is_real:
+            return True, {"verified": True, "distance": dist, "model_name": "ArcFace", "reference": paths[best]}, None
         return False, None, "Spoofing detected"
         
     return False, None, "Face not matched"
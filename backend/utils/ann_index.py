@@ -0,0 +1,102 @@
+import numpy as np
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+
+class IVFIndex:
+    """
+    Inverted-file index over unit-length embeddings (pure NumPy).
+
+    Embeddings are clustered with spherical k-means; a query only scans the
+    `nprobe` clusters whose centroids are most similar to it, so search cost
+    grows with roughly sqrt(N) instead of N.
+    """
+
+    def __init__(self, nprobe=8, iterations=10, seed=0):
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+        self._lists = []        # per cluster: [ids list, (n, dim) float32 matrix]
+        self._assignment = {}   # id -> cluster
+        self.trained_size = 0
+
+    def __len__(self):
+        return len(self._assignment)
+
+    def train(self, ids, matrix):
+        """Build the index from scratch from (ids, unit-vector matrix)."""
+        n = matrix.shape[0]
+        nlist = max(1, int(4 * np.sqrt(n)))
+        rng = np.random.default_rng(self.seed)
+
+        # Train centroids on a sample, ~40 points per cluster is plenty
+        sample = matrix
+        if n > nlist * 40:
+            sample = matrix[rng.choice(n, nlist * 40, replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            filled = norms[:, 0] > 0
+            centroids[filled] = sums[filled] / norms[filled]
+
+        self.centroids = centroids
+        labels = self._nearest_centroid(matrix)
+        self._lists = []
+        self._assignment = {}
+        for c in range(nlist):
+            rows = np.flatnonzero(labels == c)
+            list_ids = [ids[r] for r in rows]
+            self._lists.append([list_ids, matrix[rows].copy()])
+            for uid in list_ids:
+                self._assignment[uid] = c
+        self.trained_size = n
+
+    def _nearest_centroid(self, vectors, chunk=8192):
+        labels = np.empty(vectors.shape[0], dtype=np.int64)
+        for start in range(0, vectors.shape[0], chunk):
+            block = vectors[start:start + chunk]
+            labels[start:start + chunk] = np.argmax(block @ self.centroids.T, axis=1)
+        return labels
+
+    def add(self, uid, vector):
+        self.remove(uid)
+        c = int(np.argmax(self.centroids @ vector))
+        list_ids, mat = self._lists[c]
+        list_ids.append(uid)
+        self._lists[c][1] = np.vstack([mat, vector[np.newaxis, :]])
+        self._assignment[uid] = c
+
+    def remove(self, uid):
+        c = self._assignment.pop(uid, None)
+        if c is None:
+            return
+        list_ids, mat = self._lists[c]
+        pos = list_ids.index(uid)
+        list_ids.pop(pos)
+        self._lists[c][1] = np.delete(mat, pos, axis=0)
+
+    def search(self, query, k):
+        """Return [(id, score), ...] for the approximate top-k neighbours of a unit vector."""
+        probe = top_k(self.centroids @ query, self.nprobe)
+        cand_ids = []
+        blocks = []
+        for c in probe:
+            list_ids, mat = self._lists[c]
+            if list_ids:
+                cand_ids.extend(list_ids)
+                blocks.append(mat)
+        if not blocks:
+            return []
+        scores = np.concatenate(blocks) @ query
+        return [(cand_ids[i], float(scores[i])) for i in top_k(scores, k)]
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import threading
+from datetime import datetime
+from extensions import db
+from utils.session_cache import ChangeStamp
+
+
+class DashboardCounters:
+    """
+    Incrementally maintained numbers for /teacher/dashboard.
+
+    Loaded from the DB once per day (or when another process signals a
+    change through the stamp file), then kept current by calling
+    record_attendance() / student_added() where rows are inserted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.day = None
+        self.total_students = 0
+        self.present_ids = set()
+        self.version = 0
+        self._stamp = ChangeStamp()
+        self._stamp_seen = None
+
+    def init_app(self, app):
+        self._stamp.init(app.config.get('DASHBOARD_STAMP_FILE') or os.path.join(app.instance_path, 'dashboard.stamp'))
+
+    def _today(self):
+        return datetime.utcnow().date()
+
+    def _reload(self, stamp):
+        from models import User, Attendance
+
+        today = self._today()
+        today_start = datetime.combine(today, datetime.min.time())
+        total = User.query.filter_by(role='student').count()
+        present = {sid for (sid,) in db.session.query(Attendance.student_id).filter(Attendance.timestamp >= today_start).distinct()}
+        with self._lock:
+            self.day = today
+            self.total_students = total
+            self.present_ids = present
+            self._loaded = True
+            self._stamp_seen = stamp
+            self.version += 1
+
+    def snapshot(self):
+        """Return (total_students, present_today, state version string). Needs an app context on reload."""
+        stamp = self._stamp.read()
+        if not self._loaded or self.day != self._today() or stamp != self._stamp_seen:
+            self._reload(stamp)
+        with self._lock:
+            total, present = self.total_students, len(self.present_ids)
+            state = f"{self.day.isoformat()}:{total}:{present}"
+        # Derived from the values themselves, so every process agrees on it
+        return total, present, hashlib.sha1(state.encode()).hexdigest()[:16]
+
+    def record_attendance(self, student_id, timestamp):
+        """Call after an Attendance row was inserted. Signals other processes even if this one never loaded."""
+        with self._lock:
+            current = self._loaded and timestamp.date() == self.day
+            if current and student_id in self.present_ids:
+                return
+            if current:
+                self.present_ids.add(student_id)
+                self.version += 1
+            self._touch(current)
+
+    def student_added(self):
+        with self._lock:
+            if self._loaded:
+                self.total_students += 1
+                self.version += 1
+            self._touch(self._loaded)
+
+    def _touch(self, up_to_date):
+        # Caller holds the lock. Only mark the new stamp as seen if our own counters already reflect the change.
+        stamp = self._stamp.touch(self.version)
+        if up_to_date:
+            self._stamp_seen = stamp
+
+
+dashboard_counters = DashboardCounters()
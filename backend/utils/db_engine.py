@@ -0,0 +1,97 @@
+"""
+Database engine settings driven by Config / environment.
+
+SQLite gets WAL, busy_timeout, synchronous and mmap_size pragmas on every
+new connection so concurrent /mark and /quiz/submit writes wait for the
+write lock instead of failing with "database is locked". Postgres gets a
+sized, pre-pinged connection pool and a per-connection statement_timeout.
+"""
+from sqlalchemy import event, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+
+_UPSERTS = {"sqlite": sqlite_insert, "postgresql": pg_insert}
+
+
+def upsert_for(dialect):
+    """The dialect's insert() with on_conflict_do_*(), or None where there is no INSERT ... ON CONFLICT."""
+    return _UPSERTS.get(dialect.name)
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database URL."""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {
+            "connect_args": {
+                "timeout": config['SQLITE_BUSY_TIMEOUT_MS'] / 1000,  # Python-side lock wait; busy_timeout below covers the rest
+                "check_same_thread": False  # Connections move between the request threads and the job pool
+            }
+        }
+
+    options = {
+        "pool_size": config['DB_POOL_SIZE'],
+        "max_overflow": config['DB_MAX_OVERFLOW'],
+        "pool_timeout": config['DB_POOL_TIMEOUT_S'],
+        "pool_recycle": config['DB_POOL_RECYCLE_S'],
+        "pool_pre_ping": config['DB_POOL_PRE_PING']
+    }
+    if url.get_backend_name() == 'postgresql' and config['DB_STATEMENT_TIMEOUT_MS']:
+        # libpq startup option, so it applies to every pooled connection
+        options["connect_args"] = {"options": f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+
+def init_app(app):
+    """Merge engine options into app.config; call before db.init_app(app)."""
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})  # Explicit settings win
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def install_pragmas(engine, config):
+    """Register the SQLite connect hook; a no-op for other databases."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}"
+    ]
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def effective_settings(engine):
+    """Settings as the database reports them, for the startup log and /health."""
+    settings = {
+        "url": engine.url.render_as_string(hide_password=True),
+        "dialect": engine.dialect.name,
+        "pool": engine.pool.__class__.__name__,
+        "pool_status": engine.pool.status()
+    }
+    with engine.connect() as conn:
+        if engine.dialect.name == 'sqlite':
+            for name in ("journal_mode", "synchronous", "busy_timeout", "mmap_size"):
+                settings[name] = conn.execute(text(f"PRAGMA {name}")).scalar()
+        elif engine.dialect.name == 'postgresql':
+            settings["statement_timeout"] = conn.execute(text("SHOW statement_timeout")).scalar()
+            settings["pool_size"] = engine.pool.size()
+            settings["max_overflow"] = engine.pool._max_overflow
+            settings["pre_ping"] = engine.pool._pre_ping
+    return settings
+
+
+def report(engine):
+    settings = effective_settings(engine)
+    print(f"[DB] {settings.pop('dialect')} at {settings.pop('url')}")
+    settings.pop('pool_status')
+    print("[DB] " + ", ".join(f"{k}={v}" for k, v in settings.items()))
@@ -0,0 +1,98 @@
+import json
+import threading
+import time
+from collections import deque
+
+
+class Subscriber:
+    def __init__(self, maxlen, topics=None):
+        self.events = deque(maxlen=maxlen)  # oldest events are dropped for slow clients
+        self.cond = threading.Condition()
+        self.topics = topics  # Event names this client wants; None = all
+
+
+class EventBroker:
+    """
+    In-process fan-out for Server-Sent Events.
+
+    publish() formats each event once and appends it to the bounded buffer
+    of every subscriber interested in that topic; subscribers block on their
+    own condition variable, so N open streams cost O(events) work and no DB
+    queries. publish() only reaches streams served by the same process; a
+    stream given a `refresh` callable polls it every `refresh_interval`
+    seconds to pick up changes made by other processes.
+    """
+
+    def __init__(self, buffer_size=100, keepalive=15, refresh_interval=2):
+        self.buffer_size = buffer_size
+        self.keepalive = keepalive
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._next_id = 0
+        self.published = 0
+
+    def init_app(self, app):
+        self.buffer_size = app.config.get('EVENT_BUFFER_SIZE', self.buffer_size)
+        self.keepalive = app.config.get('EVENT_KEEPALIVE_S', self.keepalive)
+        self.refresh_interval = app.config.get('EVENT_REFRESH_S', self.refresh_interval)
+
+    def publish(self, event, data):
+        with self._lock:
+            self._next_id += 1
+            message = f"id: {self._next_id}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+            subscribers = list(self._subscribers)
+            self.published += 1
+        for sub in subscribers:
+            if sub.topics is not None and event not in sub.topics:
+                continue
+            with sub.cond:
+                sub.events.append(message)
+                sub.cond.notify()
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def stream(self, initial=None, topics=None, refresh=None):
+        """
+        Generator of SSE frames for one client; `initial` is sent first. `topics`
+        limits the events delivered. `refresh()` may return an extra frame (or None).
+        """
+        sub = Subscriber(self.buffer_size, frozenset(topics) if topics is not None else None)
+        with self._lock:
+            self._subscribers.add(sub)
+        wait = min(self.keepalive, self.refresh_interval) if refresh else self.keepalive
+        try:
+            yield "retry: 3000\n\n"
+            if initial:
+                yield initial
+            last_sent = next_refresh = time.monotonic()
+            while True:
+                with sub.cond:
+                    if not sub.events:
+                        sub.cond.wait(wait)
+                    pending = list(sub.events)
+                    sub.events.clear()
+                now = time.monotonic()
+                if refresh and now >= next_refresh:
+                    next_refresh = now + self.refresh_interval
+                    frame = refresh()
+                    if frame:
+                        pending.append(frame)
+                if pending:
+                    yield "".join(pending)
+                    last_sent = now
+                elif now - last_sent >= self.keepalive:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield f": keepalive {int(time.time())}\n\n"
+                    last_sent = now
+        finally:
+            with self._lock:
+                self._subscribers.discard(sub)
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+event_broker = EventBroker()
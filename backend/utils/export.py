@@ -0,0 +1,169 @@
+"""
+Streaming attendance export (CSV or Parquet).
+
+Rows come from one SELECT over attendance joined with users and lectures,
+read through a server-side cursor (stream_results) in fixed-size
+partitions; each partition is encoded and yielded before the next is
+fetched, so memory stays flat no matter how many rows the term has.
+
+Parquet is written with pyarrow (listed in requirements.txt); CSV needs nothing extra.
+"""
+import csv
+import io
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from models import Attendance, Lecture, User
+
+COLUMNS = [
+    "attendance_id", "timestamp", "status", "confidence", "distance_km",
+    "student_id", "student_name", "lecture_id", "subject", "teacher_id",
+    "teacher_name", "lecture_start"
+]
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet")
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_date(value, end=False):
+    """ISO date or datetime; a bare end date includes that whole day."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f"Invalid date: {value}")
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def export_query(start=None, end=None, subject=None, teacher_id=None):
+    student = aliased(User)
+    teacher = aliased(User)
+    stmt = select(
+        Attendance.id, Attendance.timestamp, Attendance.status, Attendance.confidence, Attendance.distance,
+        Attendance.student_id, student.name, Attendance.lecture_id, Lecture.subject, Lecture.teacher_id,
+        teacher.name, Lecture.start_time
+    ).select_from(Attendance) \
+        .join(student, student.id == Attendance.student_id) \
+        .outerjoin(Lecture, Lecture.id == Attendance.lecture_id) \
+        .outerjoin(teacher, teacher.id == Lecture.teacher_id)
+
+    if start:
+        stmt = stmt.where(Attendance.timestamp >= start)
+    if end:
+        stmt = stmt.where(Attendance.timestamp < end)
+    if subject:
+        stmt = stmt.where(Lecture.subject == subject)
+    if teacher_id:
+        stmt = stmt.where(Lecture.teacher_id == teacher_id)
+    # Timestamp order walks ix_attendance_timestamp and keeps reports readable
+    return stmt.order_by(Attendance.timestamp, Attendance.id)
+
+
+def iter_partitions(engine, stmt, chunk_size):
+    """Yield lists of up to chunk_size rows from a server-side cursor."""
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(stmt)
+        for partition in result.partitions(chunk_size):
+            yield partition
+
+
+def csv_chunks(partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for rows in partitions:
+        writer.writerows(
+            [r[0], r[1].isoformat() if r[1] else "", *r[2:11], r[11].isoformat() if r[11] else ""]
+            for r in rows
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _DrainableSink:
+    """Write-only file object for pyarrow whose contents are taken after each row group."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def parquet_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("attendance_id", pa.int64()), ("timestamp", pa.timestamp("us")), ("status", pa.string()),
+        ("confidence", pa.float64()), ("distance_km", pa.float64()), ("student_id", pa.string()),
+        ("student_name", pa.string()), ("lecture_id", pa.int64()), ("subject", pa.string()),
+        ("teacher_id", pa.string()), ("teacher_name", pa.string()), ("lecture_start", pa.timestamp("us"))
+    ])
+
+
+def parquet_chunks(partitions):
+    """One Parquet row group per partition, yielded as soon as it is written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    try:
+        for rows in partitions:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()  # Footer
+    yield sink.drain()
+
+
+def require_format(fmt):
+    if fmt not in FORMATS:
+        raise ExportError(f"Unsupported format '{fmt}', expected one of: {', '.join(FORMATS)}")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportError("Parquet export requires pyarrow, which is missing from this install (pip install -r requirements.txt)")
+
+
+def export_chunks(engine, fmt, chunk_size, **filters):
+    """Validated generator of encoded chunks (str for CSV, bytes for Parquet)."""
+    require_format(fmt)
+    stmt = export_query(**filters)
+    partitions = iter_partitions(engine, stmt, chunk_size)
+    return csv_chunks(partitions) if fmt == "csv" else parquet_chunks(partitions)
@@ -0,0 +1,283 @@
+import json
+import threading
+import numpy as np
+from extensions import db
+from config import Config
+from utils.ann_index import IVFIndex, top_k
+
+
+def normalize_rows(vectors):
+    """
+    L2-normalise a single embedding or a stack of embeddings as float32.
+    With unit vectors, cosine similarity is a plain dot product.
+    """
+    arr = np.asarray(vectors, dtype=np.float32)
+    if arr.ndim == 1:
+        arr = arr[np.newaxis, :]
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return arr / norms
+
+
+# Singleton so every request thread in the process shares one gallery
+class FaceGallery:
+    """
+    All enrolled face templates as one float32 matrix.
+    A user may own several templates (rows); matching takes the max
+    similarity over a user's rows.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(FaceGallery, cls).__new__(cls)
+            cls._instance.initialize()
+        return cls._instance
+
+    def initialize(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self.initialize_storage()
+
+    def initialize_storage(self):
+        self._buffer = None   # (capacity, dim) float32, rows [0, size) are live
+        self._owner = None    # (capacity,) int64, row -> user slot
+        self._size = 0
+        self._keys = []       # row -> template key
+        self._key_rows = {}   # template key -> row
+        self._users = []      # slot -> user id
+        self._user_slot = {}  # user id -> slot
+        self._user_rows = {}  # user id -> set of rows
+        self._index = None    # IVFIndex over template keys, built lazily for large galleries
+
+    # -------------------------
+    # Loading
+    # -------------------------
+
+    def ensure_loaded(self):
+        """Load all enrolled templates once per process. Needs an app context."""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self.load_from_db()
+
+    def load_from_db(self):
+        from models import FaceEmbedding, User
+
+        with self._lock:
+            self.initialize_storage()
+            for template in FaceEmbedding.query.all():
+                self._add(template.user_id, template.id, normalize_rows(template.to_array())[0])
+
+            # Users enrolled before binary templates existed
+            legacy = db.session.query(User.id, User.face_encoding).filter(User.face_encoding.isnot(None)).all()
+            for user_id, encoding in legacy:
+                if user_id in self:
+                    continue
+                try:
+                    self._add(user_id, ("legacy", user_id), normalize_rows(json.loads(encoding))[0])
+                except (TypeError, ValueError) as e:
+                    print(f"[GALLERY] Skipping bad encoding for {user_id}: {e}")
+            self._loaded = True
+        print(f"[GALLERY] Loaded {self._size} templates for {len(self)} users")
+
+    def load_user(self, user_id):
+        """(Re)load one user's templates, e.g. after enrollment in another process."""
+        from models import FaceEmbedding, User
+
+        templates = FaceEmbedding.query.filter_by(user_id=user_id).all()
+        with self._lock:
+            self.remove_user(user_id)
+            for template in templates:
+                self._add(user_id, template.id, normalize_rows(template.to_array())[0])
+            if not templates:
+                user = User.query.get(user_id)
+                if user and user.face_encoding:
+                    self._add(user_id, ("legacy", user_id), normalize_rows(json.loads(user.face_encoding))[0])
+
+    # -------------------------
+    # Updates (enrollment)
+    # -------------------------
+
+    def add_template(self, user_id, key, embedding):
+        """Add or replace one template (keyed by FaceEmbedding.id) in place."""
+        with self._lock:
+            self._add(user_id, key, normalize_rows(embedding)[0])
+
+    def _add(self, user_id, key, vector):
+        if self._index is not None:
+            self._index.add(key, vector)
+        row = self._key_rows.get(key)
+        if row is not None:
+            self._buffer[row] = vector
+            return
+
+        slot = self._user_slot.get(user_id)
+        if slot is None:
+            slot = len(self._users)
+            self._users.append(user_id)
+            self._user_slot[user_id] = slot
+
+        self._reserve(self._size + 1, vector.shape[0])
+        row = self._size
+        self._buffer[row] = vector
+        self._owner[row] = slot
+        self._keys.append(key)
+        self._key_rows[key] = row
+        self._user_rows.setdefault(user_id, set()).add(row)
+        self._size += 1
+
+    def remove_user(self, user_id):
+        with self._lock:
+            # Highest rows first, so rows still to be removed never get moved
+            for row in sorted(self._user_rows.get(user_id, ()), reverse=True):
+                self._remove_row(row)
+            self._user_rows.pop(user_id, None)
+
+    def _remove_row(self, row):
+        key = self._keys[row]
+        user_id = self._users[self._owner[row]]
+        if self._index is not None:
+            self._index.remove(key)
+        del self._key_rows[key]
+        self._user_rows[user_id].discard(row)
+
+        last = self._size - 1
+        if row != last:
+            # Move the last row into the hole so the live block stays dense.
+            # Copy first: snapshots handed out earlier must not see rows shift.
+            self._buffer = self._buffer.copy()
+            self._owner = self._owner.copy()
+            self._buffer[row] = self._buffer[last]
+            self._owner[row] = self._owner[last]
+            moved_key = self._keys[last]
+            moved_user = self._users[self._owner[last]]
+            self._keys[row] = moved_key
+            self._key_rows[moved_key] = row
+            self._user_rows[moved_user].discard(last)
+            self._user_rows[moved_user].add(row)
+        self._keys.pop()
+        self._size -= 1
+
+    def _reserve(self, capacity, dim):
+        if self._buffer is None:
+            capacity = max(capacity, 64)
+            self._buffer = np.empty((capacity, dim), dtype=np.float32)
+            self._owner = np.empty(capacity, dtype=np.int64)
+        elif capacity > self._buffer.shape[0]:
+            capacity = max(capacity, self._buffer.shape[0] * 2)
+            grown = np.empty((capacity, dim), dtype=np.float32)
+            grown[:self._size] = self._buffer[:self._size]
+            owner = np.empty(capacity, dtype=np.int64)
+            owner[:self._size] = self._owner[:self._size]
+            self._buffer, self._owner = grown, owner
+
+    # -------------------------
+    # Lookups
+    # -------------------------
+
+    def __contains__(self, user_id):
+        return bool(self._user_rows.get(user_id))
+
+    def __len__(self):
+        """Number of enrolled users."""
+        return sum(1 for rows in self._user_rows.values() if rows)
+
+    def template_count(self, user_id):
+        return len(self._user_rows.get(user_id, ()))
+
+    def snapshot(self):
+        """Return (user ids by slot, template matrix, row -> slot array)."""
+        with self._lock:
+            if self._buffer is None:
+                return [], np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.int64)
+            return list(self._users), self._buffer[:self._size], self._owner[:self._size]
+
+    def similarity(self, user_id, embedding):
+        """Max cosine similarity between an embedding and a user's templates, or None if not enrolled."""
+        with self._lock:
+            rows = list(self._user_rows.get(user_id, ()))
+            if not rows:
+                return None
+            stored = self._buffer[rows]
+        return float(np.max(stored @ normalize_rows(embedding)[0]))
+
+    def similarities(self, embeddings):
+        """
+        Compare many probe embeddings against every user in one matrix multiply.
+        Returns (user ids, scores) where scores has shape (n_probes, n_users)
+        and each entry is the best score over that user's templates
+        (-inf for users with no templates left).
+        """
+        users, matrix, owner = self.snapshot()
+        probes = normalize_rows(embeddings)
+        if not users:
+            return users, np.empty((probes.shape[0], 0), dtype=np.float32)
+        return users, self._reduce_by_user(probes @ matrix.T, owner, len(users))
+
+    @staticmethod
+    def _reduce_by_user(template_scores, owner, n_users):
+        best = np.full((template_scores.shape[0], n_users), -np.inf, dtype=np.float32)
+        np.maximum.at(best, (slice(None), owner), template_scores)
+        return best
+
+    # -------------------------
+    # 1:N identification
+    # -------------------------
+
+    def search(self, embedding, k=5):
+        """
+        Find the k enrolled users most similar to an embedding.
+        Exact brute force for small galleries; an IVF index once the gallery
+        reaches Config.ANN_MIN_GALLERY_SIZE templates so latency stays roughly flat.
+        Returns [(user id, cosine similarity), ...], best first.
+        """
+        query = normalize_rows(embedding)[0]
+
+        if self._size >= Config.ANN_MIN_GALLERY_SIZE:
+            with self._lock:
+                self._ensure_index()
+                # Over-fetch templates so k distinct users survive de-duplication
+                hits = self._index.search(query, k * Config.MAX_TEMPLATES_PER_USER)
+                best = {}
+                for key, score in hits:
+                    user_id = self._users[self._owner[self._key_rows[key]]]
+                    best.setdefault(user_id, score)
+                return list(best.items())[:k]
+
+        users, matrix, owner = self.snapshot()
+        if not users:
+            return []
+        scores = self._reduce_by_user((matrix @ query)[np.newaxis, :], owner, len(users))[0]
+        return [(users[i], float(scores[i])) for i in top_k(scores, k) if scores[i] > -np.inf]
+
+    def _ensure_index(self):
+        # Retrain when the gallery has doubled since the last build so the
+        # cluster count keeps up with enrollment
+        if self._index is None or self._size > 2 * self._index.trained_size:
+            index = IVFIndex(nprobe=Config.ANN_NPROBE)
+            index.train(self._keys, self._buffer[:self._size])
+            self._index = index
+            print(f"[GALLERY] Built IVF index over {self._size} templates ({len(index.centroids)} lists)")
+
+
+def enroll_template(user_id, embedding):
+    """Store a new binary template for a user and add it to the gallery."""
+    from models import FaceEmbedding
+
+    template = FaceEmbedding.from_array(
+        user_id,
+        embedding,
+        dtype=Config.EMBEDDING_STORAGE_DTYPE,
+        model_name=Config.FACE_MODEL_NAME,
+        model_version=Config.FACE_MODEL_VERSION
+    )
+    db.session.add(template)
+    db.session.commit()
+    face_gallery.add_template(user_id, template.id, template.to_array())
+    return template
+
+
+face_gallery = FaceGallery()
@@ -1,9 +1,19 @@
 import cv2
 import numpy as np
-import base64
+import binascii
+import struct
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from deepface import DeepFace
 from config import Config
-from scipy.spatial.distance import cosine
+from utils.face_gallery import face_gallery
+from utils.inference_pool import inference_pool
+from utils.metrics import face_stage, cache_requests
+
+# Cosine distance threshold for ArcFace (lower is stricter)
+COSINE_THRESHOLD = 0.45
 
 # Singleton for models to ensure they load only once
 class FaceModel:
@@ -16,7 +26,7 @@ class FaceModel:
         return cls._instance
 
     def initialize(self):
-        print("Loading Face Recognition Models... (RetinaFace + ArcFace)")
+        print(f"Loading Face Recognition Models... ({Config.FACE_DETECTOR_BACKEND} + ArcFace)")
         # We trigger a dummy build to load weights into memory
         try:
             DeepFace.build_model("ArcFace")
@@ -26,41 +36,417 @@ class FaceModel:
         except Exception as e:
             print(f"Error loading models: {e}")
 
-# Initialize models at startup
-face_model = FaceModel()
+# Initialize models at startup, unless inference runs in worker processes
+face_model = FaceModel() if Config.INFERENCE_WORKERS == 0 else None
 
 def decode_base64_to_cv2_image(data_url):
     try:
-        encoded_data = data_url.split(',')[1]
-        nparr = np.frombuffer(base64.b64decode(encoded_data), np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        return img
+        # Slice once after the comma instead of split(), which copies every part
+        encoded_data = data_url[data_url.index(',') + 1:]
+        return decode_image_bytes(binascii.a2b_base64(encoded_data))
     except Exception as e:
         print(f"Error decoding image: {e}")
         return None
 
+def decode_image_payload(payload):
+    """Decode either a base64 data URL (JSON clients) or raw encoded image bytes (binary uploads)."""
+    with face_stage.time("decode"):
+        if isinstance(payload, str):
+            return decode_base64_to_cv2_image(payload)
+        try:
+            return decode_image_bytes(payload)
+        except Exception as e:
+            print(f"Error decoding image: {e}")
+            return None
+
+# -------------------------
+# Image preprocessing
+# -------------------------
+
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+def image_size(buf):
+    """Read (width, height) from a JPEG or PNG header without decoding, or None."""
+    buf = memoryview(buf).cast("B")  # index as Python ints, no copy
+    data = bytes(buf[:24])
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return struct.unpack(">II", data[16:24])
+    if data[:2] != b"\xff\xd8":
+        return None
+    # Walk JPEG segments up to the first start-of-frame marker
+    i, n = 2, len(buf)
+    while i + 9 < n:
+        if buf[i] != 0xFF:
+            return None
+        marker = buf[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        length = (buf[i + 2] << 8) | buf[i + 3]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = (buf[i + 5] << 8) | buf[i + 6]
+            width = (buf[i + 7] << 8) | buf[i + 8]
+            return width, height
+        i += 2 + length
+    return None
+
+def decode_image_bytes(buf, max_side=None):
+    """
+    Decode an encoded image into a BGR frame whose longest side is at most
+    `max_side` (Config.IMAGE_MAX_SIDE by default).
+    JPEGs larger than the bound are decoded directly at 1/2, 1/4 or 1/8
+    scale (cv2.IMREAD_REDUCED_*), so a 12 MP photo never materialises at
+    full size. OpenCV applies the EXIF orientation tag on decode.
+    The returned frame is always a fresh array owned by the caller.
+    """
+    max_side = max_side or Config.IMAGE_MAX_SIDE
+    arr = np.frombuffer(buf, np.uint8)
+
+    flags = cv2.IMREAD_COLOR
+    size = image_size(arr)
+    if size:
+        longest = max(size)
+        for factor, reduced in _REDUCED_FLAGS:
+            if longest // factor >= max_side:
+                flags = reduced
+                break
+
+    img = cv2.imdecode(arr, flags)
+    if img is None:
+        return None
+
+    h, w = img.shape[:2]
+    if max(h, w) <= max_side:
+        return img
+
+    scale = max_side / max(h, w)
+    # After a reduced decode the remaining ratio is < 2x, where bilinear is enough and much cheaper
+    interpolation = cv2.INTER_LINEAR if scale > 0.5 else cv2.INTER_AREA
+    return cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=interpolation)
+
+# -------------------------
+# Face presence cascade
+# -------------------------
+
+_precheck_local = threading.local()
+_precheck_lock = threading.Lock()
+_precheck_kind = None  # Set when the configured detector could not be built and a fallback is in use
+
+def _create_detector(kind):
+    if kind == "yunet":
+        return cv2.FaceDetectorYN.create(Config.FACE_PRECHECK_MODEL, "", (320, 320), 0.6)
+    detector = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    if detector.empty():
+        raise RuntimeError("Haar cascade file could not be loaded")
+    return detector
+
+def _precheck_detector():
+    """
+    (kind, detector) for this thread; OpenCV detectors are not thread-safe, so
+    each thread gets its own. If the configured detector cannot be built (e.g.
+    an OpenCV build without CascadeClassifier) the process falls back, once,
+    to YuNet when FACE_PRECHECK_MODEL is set, otherwise to no precheck.
+    """
+    global _precheck_kind
+    cached = getattr(_precheck_local, "detector", None)
+    if cached is not None:
+        return cached
+    while True:
+        kind = _precheck_kind or Config.FACE_PRECHECK
+        if kind == "none":
+            cached = ("none", None)
+            break
+        try:
+            cached = (kind, _create_detector(kind))
+            break
+        except Exception as e:
+            fallback = "yunet" if kind == "haar" and Config.FACE_PRECHECK_MODEL else "none"
+            with _precheck_lock:
+                if (_precheck_kind or Config.FACE_PRECHECK) == kind:
+                    print(f"Face precheck '{kind}' unavailable ({e}); falling back to '{fallback}'")
+                    _precheck_kind = fallback
+    _precheck_local.detector = cached
+    return cached
+
+def precheck_face(img):
+    """
+    Fast face-presence check on a downscaled copy of the frame.
+    Returns None if there is no plausible face, otherwise the frame cropped
+    (with margin) around the candidate faces so the full detector has less
+    to scan. Returns the frame unchanged when the cascade is disabled.
+    """
+    kind, detector = _precheck_detector()
+    if detector is None:
+        return img
+
+    h, w = img.shape[:2]
+    scale = min(1.0, Config.FACE_PRECHECK_MAX_SIDE / max(h, w))
+    small = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA) if scale < 1.0 else img
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    # Blank or very dark frames
+    if gray.std() < Config.FACE_PRECHECK_MIN_CONTRAST:
+        return None
+
+    if kind == "yunet":
+        detector.setInputSize((small.shape[1], small.shape[0]))
+        _, found = detector.detect(small)
+        boxes = [] if found is None else found[:, :4]
+    else:
+        boxes = detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4, minSize=(24, 24))
+    if len(boxes) == 0:
+        return None
+    if not Config.FACE_PRECHECK_CROP:
+        return img
+
+    # Union of candidate boxes, padded by half a face so RetinaFace can still align
+    boxes = np.asarray(boxes, dtype=np.float32) / scale
+    x0, y0 = boxes[:, 0].min(), boxes[:, 1].min()
+    x1, y1 = (boxes[:, 0] + boxes[:, 2]).max(), (boxes[:, 1] + boxes[:, 3]).max()
+    pad = 0.5 * max(boxes[:, 2].max(), boxes[:, 3].max())
+    x0, y0 = max(0, int(x0 - pad)), max(0, int(y0 - pad))
+    x1, y1 = min(w, int(x1 + pad)), min(h, int(y1 + pad))
+    return img[y0:y1, x0:x1]
+
 def get_embedding(img_path_or_array):
     """
     Generate 512-dim embedding using ArcFace.
+    In-memory frames go through the micro-batching scheduler so concurrent
+    requests share one forward pass (in the worker pool if configured);
+    file paths are embedded directly.
     """
+    if isinstance(img_path_or_array, np.ndarray):
+        try:
+            # Cheap cascade first: blank/dark/face-less frames never reach the detector
+            with face_stage.time("precheck"):
+                img_path_or_array = precheck_face(img_path_or_array)
+            if img_path_or_array is None:
+                print("No plausible face in frame (precheck)")
+                return None
+            # Queue wait + detect + embed, wherever they run (worker processes report no stage timings)
+            if Config.INFERENCE_BATCHING:
+                with face_stage.time("inference"):
+                    return inference_scheduler.submit(img_path_or_array).result(timeout=Config.INFERENCE_TIMEOUT_S)
+            if inference_pool:
+                with face_stage.time("inference"):
+                    return inference_pool.run_batch([img_path_or_array])[0]
+        except Exception as e:
+            print(f"Error generating embedding: {e}")
+            return None
+    return _represent_single(img_path_or_array)
+
+def _represent_single(img_path_or_array):
     try:
-        embedding_objs = DeepFace.represent(
-            img_path=img_path_or_array,
-            model_name="ArcFace",
-            detector_backend="retinaface",
-            enforce_detection=True,
-            align=True
-        )
+        # DeepFace.represent detects and embeds in one call
+        with face_stage.time("detect_embed"):
+            embedding_objs = DeepFace.represent(
+                img_path=img_path_or_array,
+                model_name="ArcFace",
+                detector_backend=Config.FACE_DETECTOR_BACKEND,
+                enforce_detection=True,
+                align=True
+            )
         if embedding_objs and len(embedding_objs) > 0:
             return embedding_objs[0]["embedding"]
     except Exception as e:
         print(f"Error generating embedding: {e}")
     return None
 
+def _detect_faces(img, enforce_detection=True):
+    with face_stage.time("detect"):
+        return DeepFace.extract_faces(
+            img_path=img,
+            detector_backend=Config.FACE_DETECTOR_BACKEND,
+            enforce_detection=enforce_detection,
+            align=True
+        )
+
+def _embed_faces(faces):
+    """One ArcFace forward pass over aligned face crops (RGB, [0, 1]). Returns an (n, 512) array."""
+    with face_stage.time("embed"):
+        batch = np.concatenate([_prepare_face(face) for face in faces])
+        model = DeepFace.build_model("ArcFace")
+        return np.asarray(model.model(batch, training=False))
+
+def embed_batch(images):
+    """
+    Detect + embed a list of frames with a single ArcFace forward pass.
+    Returns one embedding (list) or None per input frame.
+    """
+    faces = [None] * len(images)
+    for i, img in enumerate(images):
+        try:
+            face_objs = _detect_faces(img)
+            if face_objs:
+                faces[i] = face_objs[0]["face"]
+        except Exception as e:
+            print(f"Error detecting face: {e}")
+
+    results = [None] * len(images)
+    detected = [i for i, face in enumerate(faces) if face is not None]
+    if not detected:
+        return results
+
+    try:
+        vectors = _embed_faces([faces[i] for i in detected])
+        for row, i in enumerate(detected):
+            results[i] = vectors[row].tolist()
+    except Exception as e:
+        # Fall back to one forward pass per frame (e.g. a DeepFace version without .model)
+        print(f"Batched embedding failed, falling back to single images: {e}")
+        for i in detected:
+            results[i] = _represent_single(images[i])
+    return results
+
+def embed_faces(img):
+    """
+    Detect every face in one frame (e.g. a classroom photo) and embed them
+    all in one batch. Returns [{"embedding": [...], "facial_area": {...}}, ...].
+    Runs in the inference worker pool when one is configured, so the web
+    process never loads the models.
+    """
+    if inference_pool:
+        with face_stage.time("inference"):
+            return inference_pool.run_faces(img)
+    return detect_embed_faces(img)
+
+def detect_embed_faces(img):
+    """In-process body of embed_faces (also what the pool workers run)."""
+    try:
+        face_objs = _detect_faces(img, enforce_detection=False)
+    except Exception as e:
+        print(f"Error detecting faces: {e}")
+        return []
+
+    # enforce_detection=False yields one whole-frame "face" with zero confidence when nothing is found
+    face_objs = [f for f in face_objs if f.get("confidence", 0) > 0]
+    if not face_objs:
+        return []
+
+    try:
+        vectors = _embed_faces([f["face"] for f in face_objs])
+        return [{"embedding": vectors[i].tolist(), "facial_area": f["facial_area"]} for i, f in enumerate(face_objs)]
+    except Exception as e:
+        print(f"Batched embedding failed, falling back to DeepFace.represent: {e}")
+        try:
+            embedding_objs = DeepFace.represent(
+                img_path=img,
+                model_name="ArcFace",
+                detector_backend=Config.FACE_DETECTOR_BACKEND,
+                enforce_detection=True,
+                align=True
+            )
+            return [{"embedding": o["embedding"], "facial_area": o["facial_area"]} for o in embedding_objs]
+        except Exception as e:
+            print(f"Error generating embeddings: {e}")
+            return []
+
+def _prepare_face(face):
+    # Mirror DeepFace.represent: RGB [0, 1] face -> BGR, padded resize to the
+    # model input, 'base' normalisation (identity)
+    from deepface.modules import preprocessing
+
+    model = DeepFace.build_model("ArcFace")
+    target_h, target_w = model.input_shape
+    return preprocessing.resize_image(img=face[:, :, ::-1], target_size=(target_h, target_w))
+
+
+class InferenceScheduler:
+    """
+    Micro-batching front end for embed_batch.
+    Callers submit single frames and get a Future; a background thread
+    collects frames for up to `window_ms` or `max_batch` images, whichever
+    comes first, and runs them as one batch.
+    """
+
+    def __init__(self, run_batch, window_ms=10, max_batch=16, concurrency=1):
+        self.run_batch = run_batch
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        # With a worker pool, several batches can be in flight at once
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="inference-batch") if concurrency > 1 else None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._images = 0
+        self._size_counts = {}
+
+    def submit(self, img):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((img, future))
+        return future
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="inference-scheduler", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window_ms / 1000.0
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if self._executor:
+                self._executor.submit(self._run, batch)
+            else:
+                self._run(batch)
+
+    def _run(self, batch):
+        images = [img for img, _ in batch]
+        try:
+            results = self.run_batch(images)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            with self._lock:
+                self._batches += 1
+                self._images += len(batch)
+                self._size_counts[len(batch)] = self._size_counts.get(len(batch), 0) + 1
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            batches, images = self._batches, self._images
+            sizes = dict(sorted(self._size_counts.items()))
+        return {
+            "batches": batches,
+            "images": images,
+            "queue_depth": self._queue.qsize(),
+            "mean_batch_size": images / batches if batches else 0,
+            "fill_rate": images / (batches * self.max_batch) if batches else 0,
+            "batch_sizes": sizes
+        }
+
+# Batches run in the worker pool when one is configured, otherwise in-process
+inference_scheduler = InferenceScheduler(
+    inference_pool.run_batch if inference_pool else embed_batch,
+    window_ms=Config.INFERENCE_BATCH_WINDOW_MS,
+    max_batch=Config.INFERENCE_BATCH_MAX_SIZE,
+    concurrency=max(1, Config.INFERENCE_WORKERS)
+)
+
 def verify_face_logic(captured_image_path, user):
     """
     Verify face using ArcFace embeddings and Cosine Similarity.
-    Threshold: 0.45
+    Threshold: COSINE_THRESHOLD
     """
     try:
         # 1. Get embedding for captured image
@@ -68,32 +454,29 @@ def verify_face_logic(captured_image_path, user):
         if not captured_embedding:
             return {"status": "error", "message": "No face detected in captured image. Please ensure good lighting and face camera directly."}
 
-        # 2. Get stored embedding for user
-        # If user has no embedding yet, we might need to generate it from their profile image (enrollment)
-        # For now, let's assume user.face_encoding stores the embedding list/json
-        import json
-        
-        print(f"DEBUG: Checking enrollment for user {user.id}. Encoding length: {len(user.face_encoding) if user.face_encoding else 'None'}")
-
-        if not user.face_encoding:
-             # Fallback: if we have a profile image path but no embedding, generate it now (Lazy Enrollment)
-             # This is a temporary fix for migration. Ideally, enrollment happens at registration.
-             # For the 'seed' users, we might need to handle this.
-             return {"status": "error", "message": "User face not enrolled."}
+        # 2. Get stored embedding for user from the in-memory gallery
+        # The gallery holds pre-normalised float32 vectors, so no JSON parsing per request.
+        face_gallery.ensure_loaded()
 
-        stored_embedding = json.loads(user.face_encoding)
+        if user.id not in face_gallery:
+            # Enrolled after the gallery was loaded (e.g. by another process)
+            cache_requests.inc("face_gallery", "miss")
+            face_gallery.load_user(user.id)
+            if user.id not in face_gallery:
+                return {"status": "error", "message": "User face not enrolled."}
+        else:
+            cache_requests.inc("face_gallery", "hit")
 
         # 3. Calculate Cosine Similarity
-        # DeepFace.verify uses distance, where lower is better for Cosine.
-        # Cosine Distance = 1 - Cosine Similarity. 
-        # DeepFace 'cosine' metric is actually Cosine Distance.
+        # Cosine Distance = 1 - Cosine Similarity. With unit vectors the
+        # similarity is a dot product, taken as the max over all of the user's templates.
         # Threshold 0.45 for ArcFace is standard for strict matching.
-        
-        dist = cosine(captured_embedding, stored_embedding)
-        
-        print(f"Distance: {dist} (Threshold: 0.45)")
+        with face_stage.time("compare"):
+            dist = 1 - face_gallery.similarity(user.id, captured_embedding)
+
+        print(f"Distance: {dist} (Threshold: {COSINE_THRESHOLD})")
 
-        if dist < 0.45:
+        if dist < COSINE_THRESHOLD:
             return {"status": "success", "message": "Face Verified", "confidence": (1 - dist) * 100}
         else:
             return {"status": "error", "message": "Face not matched. Please try again."}
@@ -101,3 +484,33 @@ def verify_face_logic(captured_image_path, user):
     except Exception as e:
         print(f"Verification error: {e}")
         return {"status": "error", "message": f"System error: {str(e)}"}
+
+def identify_face_logic(captured_image, top_k=5):
+    """
+    1:N identification: find the enrolled user closest to the captured face.
+    Returns the top-k candidates and a match only if the best one passes COSINE_THRESHOLD.
+    """
+    try:
+        captured_embedding = get_embedding(captured_image)
+        if not captured_embedding:
+            return {"status": "error", "message": "No face detected in captured image. Please ensure good lighting and face camera directly."}
+
+        face_gallery.ensure_loaded()
+        with face_stage.time("compare"):
+            neighbours = face_gallery.search(captured_embedding, k=top_k)
+        candidates = [{"student_id": uid, "score": score} for uid, score in neighbours]
+
+        if not neighbours:
+            return {"status": "no_match", "message": "No enrolled faces.", "candidates": candidates}
+
+        best_id, best_score = neighbours[0]
+        dist = 1 - best_score
+        print(f"Best match {best_id} distance: {dist} (Threshold: {COSINE_THRESHOLD})")
+
+        if dist < COSINE_THRESHOLD:
+            return {"status": "success", "student_id": best_id, "confidence": best_score * 100, "candidates": candidates}
+        return {"status": "no_match", "message": "Face not recognised.", "candidates": candidates}
+
+    except Exception as e:
+        print(f"Identification error: {e}")
+        return {"status": "error", "message": f"System error: {str(e)}"}
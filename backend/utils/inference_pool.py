@@ -0,0 +1,180 @@
+import atexit
+import multiprocessing as mp
+import queue
+import threading
+import numpy as np
+from multiprocessing.shared_memory import SharedMemory
+from config import Config
+
+
+def _worker_main(conn, shm_name):
+    """
+    Inference worker process: loads RetinaFace/ArcFace once, then serves
+    requests of the form (operation, frames). Frames arrive in shared memory;
+    only their offsets and shapes travel through the pipe.
+    """
+    from utils.face_recognition import FaceModel, embed_batch, detect_embed_faces
+
+    operations = {
+        "embed_batch": embed_batch,  # One embedding (or None) per frame
+        "embed_faces": lambda images: [detect_embed_faces(img) for img in images]  # Every face in each frame
+    }
+    FaceModel()
+    shm = SharedMemory(name=shm_name)
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+            operation, items = message
+
+            images = []
+            for item in items:
+                if item[0] == "shm":
+                    _, offset, shape, dtype = item
+                    images.append(np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset))
+                else:
+                    images.append(item[1])
+
+            try:
+                conn.send(("ok", operations[operation](images)))
+            except Exception as e:
+                conn.send(("error", str(e)))
+            finally:
+                del images
+    finally:
+        shm.close()
+
+
+class _Worker:
+    def __init__(self, ctx, shm_bytes):
+        self.shm = SharedMemory(create=True, size=shm_bytes)
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.shm.name),
+            name="face-inference",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def pack(self, images):
+        """Copy frames into this worker's shared memory; overflow goes through the pipe."""
+        items, offset = [], 0
+        for img in images:
+            if isinstance(img, np.ndarray) and offset + img.nbytes <= self.shm.size:
+                view = np.ndarray(img.shape, dtype=img.dtype, buffer=self.shm.buf, offset=offset)
+                view[...] = img
+                items.append(("shm", offset, img.shape, img.dtype.str))
+                offset += img.nbytes
+            else:
+                items.append(("obj", img))
+        return items
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+        self.shm.close()
+        self.shm.unlink()
+
+
+class InferencePool:
+    """
+    Pool of face inference processes so TensorFlow never runs on a Flask
+    request thread. Each worker owns a shared-memory frame buffer; crashed
+    or hung workers are replaced transparently.
+    """
+
+    def __init__(self, size, shm_bytes, timeout):
+        self.size = size
+        self.shm_bytes = shm_bytes
+        self.timeout = timeout
+        self._ctx = mp.get_context("spawn")  # TensorFlow is not fork-safe
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._workers = []
+        self.restarts = 0
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            for _ in range(self.size):
+                worker = _Worker(self._ctx, self.shm_bytes)
+                self._workers.append(worker)
+                self._idle.put(worker)
+            self._started = True
+            atexit.register(self.shutdown)
+            print(f"[POOL] Started {self.size} inference workers")
+
+    def _replace(self, worker):
+        print(f"[POOL] Restarting inference worker (pid {worker.process.pid}, exit code {worker.process.exitcode})")
+        try:
+            worker.stop()
+        except Exception as e:
+            print(f"[POOL] Error stopping worker: {e}")
+        fresh = _Worker(self._ctx, self.shm_bytes)
+        with self._lock:
+            self._workers[self._workers.index(worker)] = fresh
+            self.restarts += 1
+        return fresh
+
+    def run_batch(self, images):
+        """Same contract as embed_batch, executed in a worker process."""
+        return self._run("embed_batch", images)
+
+    def run_faces(self, img):
+        """Same contract as embed_faces (every face in one frame), executed in a worker process."""
+        return self._run("embed_faces", [img])[0]
+
+    def _run(self, operation, images):
+        self._ensure_started()
+        worker = self._idle.get()
+        try:
+            if not worker.process.is_alive():
+                worker = self._replace(worker)
+            try:
+                worker.conn.send((operation, worker.pack(images)))
+                if not worker.conn.poll(self.timeout):
+                    raise TimeoutError("Inference worker timed out")
+                status, payload = worker.conn.recv()
+            except (EOFError, BrokenPipeError, ConnectionResetError, TimeoutError) as e:
+                worker = self._replace(worker)
+                raise RuntimeError(f"Inference worker failed: {e}")
+            if status != "ok":
+                raise RuntimeError(payload)
+            return payload
+        finally:
+            self._idle.put(worker)
+
+    def stats(self):
+        with self._lock:
+            alive = sum(1 for w in self._workers if w.process.is_alive())
+        return {"workers": self.size, "alive": alive, "idle": self._idle.qsize(), "restarts": self.restarts}
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+            self._started = False
+        for worker in workers:
+            worker.stop()
+
+
+inference_pool = InferencePool(
+    Config.INFERENCE_WORKERS,
+    shm_bytes=Config.INFERENCE_SHM_BYTES,
+    timeout=Config.INFERENCE_TIMEOUT_S
+) if Config.INFERENCE_WORKERS > 0 else None
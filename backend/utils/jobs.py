@@ -0,0 +1,102 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.state = "queued"  # queued, running, done, failed
+        self.result = None
+        self.http_status = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        data = {"job_id": self.id, "state": self.state}
+        if self.done.is_set():
+            data["http_status"] = self.http_status
+            data["result"] = self.result
+        return data
+
+
+class JobQueue:
+    """
+    Background execution for slow request handlers.
+    Jobs run on a thread pool inside an app context. Submissions with the
+    same key while a job is still pending collapse into that job.
+    """
+
+    def __init__(self, max_workers=8, ttl=600):
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.app = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._jobs = {}      # job id -> Job
+        self._pending = {}   # key -> job id, while queued/running
+        self._last_sweep = time.time()
+
+    def init_app(self, app):
+        self.app = app
+        self.max_workers = app.config.get('ASYNC_MARK_WORKERS', self.max_workers)
+        self.ttl = app.config.get('JOB_TTL_S', self.ttl)
+
+    def submit(self, key, fn, *args):
+        """Queue fn(*args) -> (body, http_status). Returns (job, created)."""
+        with self._lock:
+            existing = self._pending.get(key)
+            if existing:
+                return self._jobs[existing], False
+
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+            self._sweep()
+            job = Job(key)
+            self._jobs[job.id] = job
+            self._pending[key] = job.id
+
+        self._executor.submit(self._run, job, fn, args)
+        return job, True
+
+    def _run(self, job, fn, args):
+        job.state = "running"
+        try:
+            with self.app.app_context():
+                job.result, job.http_status = fn(*args)
+            job.state = "done"
+        except Exception as e:
+            print(f"[JOBS] Job {job.id} failed: {e}")
+            job.result, job.http_status = {"error": str(e)}, 500
+            job.state = "failed"
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._pending.pop(job.key, None)
+            job.done.set()
+
+    def get(self, job_id, wait=0):
+        """Look up a job, optionally blocking up to `wait` seconds for it to finish."""
+        job = self._jobs.get(job_id)
+        if job and wait > 0:
+            job.done.wait(wait)
+        return job
+
+    def queue_depth(self):
+        return len(self._pending)
+
+    def _sweep(self):
+        # Drop finished jobs past their TTL, at most every 30s
+        now = time.time()
+        if now - self._last_sweep < 30:
+            return
+        self._last_sweep = now
+        expired = [jid for jid, j in self._jobs.items() if j.finished_at and now - j.finished_at > self.ttl]
+        for jid in expired:
+            del self._jobs[jid]
+
+
+mark_jobs = JobQueue()
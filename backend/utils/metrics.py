@@ -0,0 +1,225 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters and histograms are updated where the work happens; gauges and
+callback counters read existing state (queue depths, cache hit counts)
+only when /metrics is scraped. Values are per process: with several
+gunicorn workers each one reports its own numbers, so scrape them
+individually or sum in the query.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [per-bucket counts (+Inf last), sum, count]
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        lines = self.header()
+        names = self.labelnames + ("le",)
+        for labels, (counts, total, count) in series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Callback(Metric):
+    """
+    Gauge or counter whose value is read from existing state at scrape time.
+    fn() returns a number, or a dict of label tuple -> number.
+    """
+
+    def __init__(self, name, documentation, fn, labelnames=(), kind="gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception as e:
+            print(f"[METRICS] {self.name} unavailable: {e}")
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in value.items()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, fn, labelnames=()):
+        return self.register(Callback(name, documentation, fn, labelnames, "gauge"))
+
+    def callback_counter(self, name, documentation, fn, labelnames=()):
+        return self.register(Callback(name, documentation, fn, labelnames, "counter"))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter("http_requests_total", "HTTP requests by route and status.", ("method", "endpoint", "status"))
+http_latency = registry.histogram("http_request_duration_seconds", "Time to produce the response (excludes streamed bodies).", ("method", "endpoint"))
+db_queries = registry.counter("db_queries_total", "SQL statements executed.", ("operation",))
+db_latency = registry.histogram("db_query_duration_seconds", "SQL statement execution time.", ("operation",), QUERY_BUCKETS)
+face_stage = registry.histogram("face_stage_duration_seconds", "Face pipeline stage time (decode, precheck, detect, embed, inference = queue + batch, compare, ...).", ("stage",))
+cache_requests = registry.counter("cache_requests_total", "Lookups in caches without their own counters.", ("cache", "result"))
+
+
+def _sql_operation(statement):
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+def init_app(app, engine):
+    """Install request timing and SQL listeners; register the scrape-time gauges."""
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            endpoint = request.endpoint or "unmatched"
+            http_latency.observe(time.perf_counter() - start, request.method, endpoint)
+            http_requests.inc(request.method, endpoint, response.status_code)
+        return response
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _query_start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _query_end(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_start")
+        if not starts:
+            return
+        operation = _sql_operation(statement)
+        db_latency.observe(time.perf_counter() - starts.pop(), operation)
+        db_queries.inc(operation)
+
+    _register_gauges()
+
+
+def _register_gauges():
+    from utils.face_recognition import inference_scheduler
+    from utils.inference_pool import inference_pool
+    from utils.jobs import mark_jobs
+    from utils.session_cache import active_session
+    from utils.events import event_broker
+    from utils.face_gallery import face_gallery
+    from utils.quiz_cache import quiz_keys
+    from utils.result_writer import quiz_results_writer
+
+    registry.gauge("inference_queue_depth", "Frames waiting for the micro-batching scheduler.", inference_scheduler.queue_depth)
+    registry.callback_counter("inference_batches_total", "Batches run by the inference scheduler.", lambda: inference_scheduler.stats()["batches"])
+    registry.callback_counter("inference_images_total", "Frames embedded by the inference scheduler.", lambda: inference_scheduler.stats()["images"])
+    registry.gauge("mark_jobs_pending", "Async /mark jobs queued or running.", mark_jobs.queue_depth)
+    if inference_pool:
+        registry.gauge("inference_workers_alive", "Live inference worker processes.", lambda: inference_pool.stats()["alive"])
+        registry.callback_counter("inference_worker_restarts_total", "Inference workers restarted after a crash or timeout.", lambda: inference_pool.restarts)
+    registry.callback_counter("active_session_cache_requests_total", "Active lecture cache lookups.", lambda: {
+        ("hit",): active_session.hits,
+        ("miss",): active_session.misses
+    }, ("result",))
+    registry.callback_counter("quiz_key_cache_requests_total", "Compiled quiz answer key lookups.", lambda: {
+        ("hit",): quiz_keys.hits,
+        ("miss",): quiz_keys.misses
+    }, ("result",))
+    registry.gauge("quiz_results_pending", "Quiz results queued for the next batched insert.", quiz_results_writer.pending)
+    registry.callback_counter("quiz_results_written_total", "Quiz results inserted by the batched writer.", lambda: quiz_results_writer.rows_written)
+    registry.gauge("face_gallery_templates", "Face templates held in memory.", lambda: face_gallery._size)
+    registry.gauge("sse_subscribers", "Open Server-Sent Events streams.", event_broker.subscriber_count)
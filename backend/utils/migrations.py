@@ -0,0 +1,184 @@
+"""
+Minimal versioned schema migrations.
+
+db.create_all() only creates missing tables, so anything that changes an
+existing table (indexes, constraints, columns) goes here as a numbered
+step. Applied versions are recorded in `schema_migrations`. Steps must be
+safe to run on a fresh database that create_all() already built from the
+current models (hence IF NOT EXISTS everywhere).
+
+Run with `python migrate.py`; create_app() also applies pending steps
+when Config.AUTO_MIGRATE is on.
+"""
+from datetime import datetime
+from sqlalchemy import inspect, text
+
+
+class MigrationError(Exception):
+    """A step needs an explicit decision before it can run (e.g. deleting duplicate rows)."""
+
+
+def _remove_duplicates(conn, table, keys, dedupe, where="1 = 1"):
+    """
+    Rows sharing `keys`, so a unique index can be built. Without `dedupe`
+    raise MigrationError describing them; with it, keep the earliest row of
+    each key, delete the rest and log what was removed. Returns rows deleted.
+    """
+    columns = ", ".join(keys)
+    groups = conn.execute(text(
+        f"SELECT {columns}, COUNT(*) - 1 FROM {table} WHERE {where} GROUP BY {columns} HAVING COUNT(*) > 1"
+    )).all()
+    if not groups:
+        return 0
+    extra = sum(g[-1] for g in groups)
+    if not dedupe:
+        sample = ", ".join(str(tuple(g[:-1])) for g in groups[:10]) + (", ..." if len(groups) > 10 else "")
+        raise MigrationError(
+            f"{table} has {extra} duplicate row(s) across {len(groups)} ({columns}) key(s): {sample}. "
+            f"Run `python migrate.py --dedupe` to keep the earliest row of each and delete the rest."
+        )
+    result = conn.execute(text(f"""
+        DELETE FROM {table}
+        WHERE {where} AND id NOT IN (
+            SELECT MIN(id) FROM {table}
+            WHERE {where}
+            GROUP BY {columns}
+        )
+    """))
+    print(f"[MIGRATE] Removed {result.rowcount} duplicate {table} row(s) across {len(groups)} ({columns}) key(s):")
+    for g in groups:
+        print(f"[MIGRATE]   {tuple(g[:-1])}: {g[-1]} removed")
+    return result.rowcount
+
+
+def _hot_path_indexes(conn, dedupe):
+    # Keep the earliest row for each (student, lecture) so the unique index can be built
+    _remove_duplicates(conn, "attendance", ("student_id", "lecture_id"), dedupe, where="lecture_id IS NOT NULL")
+    for ddl in (
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_attendance_student_lecture ON attendance (student_id, lecture_id)",
+        "CREATE INDEX IF NOT EXISTS ix_attendance_student_timestamp ON attendance (student_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_attendance_timestamp ON attendance (timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_lectures_is_active ON lectures (is_active)",
+        "CREATE INDEX IF NOT EXISTS ix_quiz_results_quiz_student ON quiz_results (quiz_id, student_id)",
+        "CREATE INDEX IF NOT EXISTS ix_quizzes_teacher_created ON quizzes (teacher_id, created_at)",
+    ):
+        conn.execute(text(ddl))
+
+
+def _backfill_rollups(conn, dedupe):
+    # create_all() made the table empty on existing databases
+    from utils.rollups import rebuild_statements
+    for stmt in rebuild_statements():
+        conn.execute(stmt)
+
+
+def _unique_quiz_results(conn, dedupe):
+    # Keep each student's first submission so the unique index can be built
+    _remove_duplicates(conn, "quiz_results", ("quiz_id", "student_id"), dedupe)
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_quiz_results_quiz_student ON quiz_results (quiz_id, student_id)"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_quiz_results_quiz_student"))
+
+
+def _quiz_result_answers(conn, dedupe):
+    if "answers" in {c["name"] for c in inspect(conn).get_columns("quiz_results")}:
+        return  # Fresh database: create_all() already added it
+    blob = "BYTEA" if conn.dialect.name == "postgresql" else "BLOB"
+    conn.execute(text(f"ALTER TABLE quiz_results ADD COLUMN answers {blob}"))
+
+
+# (version, name, function(connection, dedupe)); append only, never renumber
+MIGRATIONS = [
+    (1, "hot_path_indexes", _hot_path_indexes),
+    (2, "attendance_rollups", _backfill_rollups),
+    (3, "unique_quiz_results", _unique_quiz_results),
+    (4, "quiz_result_answers", _quiz_result_answers),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    """))
+
+
+def applied_versions(engine):
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def upgrade(engine, dedupe=False):
+    """
+    Apply pending migrations in order, each in its own transaction. Returns the
+    names applied. Steps that would delete duplicate rows raise MigrationError
+    unless `dedupe` is set (python migrate.py --dedupe).
+    """
+    done = applied_versions(engine)
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version in done:
+            continue
+        print(f"[MIGRATE] Applying {version:03d} {name}")
+        with engine.begin() as conn:
+            step(conn, dedupe)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.utcnow()}
+            )
+        applied.append(name)
+    return applied
+
+
+def status(engine):
+    done = applied_versions(engine)
+    return [(version, name, version in done) for version, name, _ in MIGRATIONS]
+
+
+# -------------------------
+# Query plan check
+# -------------------------
+
+# (description, SQL, params, index the planner should pick)
+HOT_QUERIES = [
+    ("attendance duplicate check",
+     "SELECT id FROM attendance WHERE student_id = :sid AND lecture_id = :lid",
+     {"sid": "S01", "lid": 1}, "uq_attendance_student_lecture"),
+    ("attendance history",
+     "SELECT * FROM attendance WHERE student_id = :sid ORDER BY timestamp DESC",
+     {"sid": "S01"}, "ix_attendance_student_timestamp"),
+    ("present today",
+     "SELECT COUNT(DISTINCT student_id) FROM attendance WHERE timestamp >= :ts",
+     {"ts": datetime(2000, 1, 1)}, "ix_attendance_timestamp"),
+    ("active lecture",
+     "SELECT * FROM lectures WHERE is_active = :active",
+     {"active": True}, "ix_lectures_is_active"),
+    ("quiz duplicate check",
+     "SELECT id FROM quiz_results WHERE quiz_id = :qid AND student_id = :sid",
+     {"qid": 1, "sid": "S01"}, "uq_quiz_results_quiz_student"),
+    ("teacher quiz list",
+     "SELECT * FROM quizzes WHERE teacher_id = :tid ORDER BY created_at DESC",
+     {"tid": "T01"}, "ix_quizzes_teacher_created"),
+]
+
+
+def check_query_plans(engine):
+    """
+    EXPLAIN each hot query and confirm the planner uses the expected index.
+    Returns a list of (description, expected index, ok, plan text).
+    """
+    results = []
+    with engine.connect() as conn:
+        sqlite = engine.dialect.name == "sqlite"
+        if not sqlite:
+            # Tiny test tables make sequential scans look cheaper; ask the planner what it would do at scale
+            conn.execute(text("SET enable_seqscan = off"))
+        for description, sql, params, index in HOT_QUERIES:
+            explain = "EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN "
+            rows = conn.execute(text(explain + sql), params).fetchall()
+            plan = "\n".join(str(row[-1]) for row in rows)
+            results.append((description, index, index in plan, plan))
+    return results
@@ -0,0 +1,83 @@
+"""
+SQL query counting, to catch N+1 regressions.
+
+QueryCounter counts statements sent through an engine while it is active.
+assert_constant_queries() calls a function at two data sizes and fails if
+the query count grows with the size of the result. check_queries.py runs
+it against the list endpoints.
+
+init_app() can also log requests that exceed QUERY_WARN_THRESHOLD queries.
+"""
+import threading
+from flask import g, request
+from sqlalchemy import event
+
+
+class QueryCounter:
+    """Context manager: `with QueryCounter(engine) as qc: ...; qc.count`."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self._thread = threading.get_ident()
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        # Only count this thread's queries; background workers share the engine
+        if threading.get_ident() == self._thread:
+            self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+        return False
+
+
+class QueryCountError(AssertionError):
+    pass
+
+
+def assert_constant_queries(engine, fn, sizes, slack=0):
+    """
+    Call fn(size) for each size and raise QueryCountError if the number of
+    queries differs by more than `slack` between sizes. Returns the counts.
+    """
+    counts = {}
+    statements = {}
+    for size in sizes:
+        with QueryCounter(engine) as qc:
+            fn(size)
+        counts[size] = qc.count
+        statements[size] = qc.statements
+    if max(counts.values()) - min(counts.values()) > slack:
+        largest = max(counts, key=counts.get)
+        sample = "\n  ".join(statements[largest][:5])
+        raise QueryCountError(f"query count grows with result size: {counts}\n  {sample}")
+    return counts
+
+
+def init_app(app, engine):
+    """Warn about requests issuing more than QUERY_WARN_THRESHOLD queries (0 = off)."""
+    threshold = app.config.get('QUERY_WARN_THRESHOLD', 0)
+    if not threshold:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        try:
+            g.query_count = g.get('query_count', 0) + 1
+        except RuntimeError:
+            pass  # Outside a request (CLI, background job)
+
+    @app.after_request
+    def _warn(response):
+        count = g.get('query_count', 0)
+        if count > threshold:
+            print(f"[QUERIES] {request.method} {request.path} ran {count} queries")
+        return response
@@ -0,0 +1,125 @@
+"""
+Item analysis for quizzes.
+
+All takers' answers (QuizResult.answers, one int8 per question) are
+stacked into an (n_takers, n_questions) matrix and every statistic is a
+vectorized pass over it:
+
+- correct rate per question
+- option (distractor) frequency per question, plus the omit rate
+- score histogram and summary
+- discrimination index: correct rate in the top 27% of takers by score
+  minus the bottom 27% (Kelley's upper/lower groups)
+
+Results are cached per quiz until its answer key version or its set of
+results changes.
+"""
+import threading
+import numpy as np
+from extensions import db
+from utils.quiz_cache import ANSWER_MAX
+
+GROUP_FRACTION = 0.27
+
+
+def answer_matrix(key, packed_answers):
+    """Stack packed answers into an int8 matrix; rows stored before answers were kept are skipped."""
+    usable = [a for a in packed_answers if a is not None and len(a) == key.total]
+    if not usable:
+        return np.empty((0, key.total), dtype=np.int8), np.zeros(len(packed_answers), dtype=bool)
+    matrix = np.frombuffer(b"".join(usable), dtype=np.int8).reshape(len(usable), key.total)
+    has_answers = np.array([a is not None and len(a) == key.total for a in packed_answers])
+    return matrix, has_answers
+
+
+def item_analysis(key, scores, packed_answers):
+    scores = np.asarray(scores, dtype=np.int64)
+    matrix, has_answers = answer_matrix(key, packed_answers)
+    n, q = matrix.shape
+
+    # Option frequencies for every question with one bincount:
+    # cell (question, answer + 1), so column 0 counts unanswered
+    width = int(max(key.options.max(initial=0), matrix.max(initial=-1) + 1)) + 1
+    flat = np.arange(q, dtype=np.int64) * width + (matrix.astype(np.int64) + 1)
+    counts = np.bincount(flat.ravel(), minlength=q * width).reshape(q, width) if n else np.zeros((q, width), dtype=np.int64)
+
+    # Only questions keyed by an option index (0..127) can be marked from the packed answers
+    keyed = key.mask & (key.key >= 0) & (key.key <= ANSWER_MAX)
+    correct = (matrix == np.where(keyed, key.key, -1).astype(np.int8)) & keyed if n else np.zeros((0, q), dtype=bool)
+    correct_rate = correct.mean(axis=0) if n else np.full(q, np.nan)
+
+    # Upper/lower groups by each taker's own score
+    taker_scores = scores[has_answers]
+    group = max(1, int(round(n * GROUP_FRACTION))) if n >= 2 else 0
+    if group:
+        order = np.argsort(taker_scores, kind="stable")
+        discrimination = correct[order[-group:]].mean(axis=0) - correct[order[:group]].mean(axis=0)
+    else:
+        discrimination = np.full(q, np.nan)
+
+    histogram = np.bincount(np.clip(scores, 0, key.total), minlength=key.total + 1) if len(scores) else np.zeros(key.total + 1, dtype=np.int64)
+
+    questions = []
+    for i in range(q):
+        options = counts[i, 1:key.options[i] + 1] if key.options[i] else counts[i, 1:]
+        questions.append({
+            "index": i,
+            "correct_answer": int(key.key[i]) if keyed[i] else None,
+            "correct_rate": _number(correct_rate[i]) if keyed[i] else None,
+            "discrimination": _number(discrimination[i]) if keyed[i] else None,
+            "omit_rate": _number(counts[i, 0] / n) if n else None,
+            "option_counts": options.tolist(),
+            "option_rates": (options / n).round(4).tolist() if n else []
+        })
+
+    return {
+        "takers": int(len(scores)),
+        "takers_with_answers": int(n),
+        "total_questions": key.total,
+        "score": {
+            "mean": _number(scores.mean()) if len(scores) else None,
+            "median": _number(np.median(scores)) if len(scores) else None,
+            "std": _number(scores.std()) if len(scores) else None,
+            "histogram": histogram.tolist()  # histogram[s] = takers scoring s
+        },
+        "questions": questions
+    }
+
+
+def _number(value):
+    return None if value is None or np.isnan(value) else round(float(value), 4)
+
+
+class QuizAnalyticsCache:
+    """Analytics per quiz, reused while the answer key version and the results (count, max id) are unchanged."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # quiz id -> (version tuple, result)
+
+    def get(self, key):
+        from models import QuizResult
+
+        count, last_id = db.session.query(db.func.count(QuizResult.id), db.func.max(QuizResult.id)) \
+            .filter(QuizResult.quiz_id == key.quiz_id).one()
+        version = (key.version, count, last_id)
+        with self._lock:
+            cached = self._entries.get(key.quiz_id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        rows = db.session.query(QuizResult.score, QuizResult.answers) \
+            .filter(QuizResult.quiz_id == key.quiz_id) \
+            .order_by(QuizResult.id) \
+            .all()
+        result = item_analysis(key, [r[0] for r in rows], [r[1] for r in rows])
+        with self._lock:
+            self._entries[key.quiz_id] = (version, result)
+        return result
+
+    def forget(self, quiz_id):
+        with self._lock:
+            self._entries.pop(quiz_id, None)
+
+
+quiz_analytics = QuizAnalyticsCache()
@@ -0,0 +1,137 @@
+import os
+import threading
+import numpy as np
+from utils.session_cache import ChangeStamp
+
+
+class AnswerKey:
+    """
+    A quiz's correct answers compiled for vectorized scoring.
+
+    Integer keys (the option indices the UI produces) live in `key`/`mask`;
+    any other JSON value as "correct" is kept in `generic` and compared
+    with ==, so scores match the original per-question loop exactly.
+    """
+
+    def __init__(self, quiz_id, questions, version):
+        self.quiz_id = quiz_id
+        self.version = version
+        self.total = len(questions)
+        self.key = np.zeros(self.total, dtype=np.int64)
+        self.mask = np.zeros(self.total, dtype=bool)
+        self.options = np.zeros(self.total, dtype=np.int64)  # Number of options per question
+        self.generic = []
+        for i, q in enumerate(questions):
+            options = q.get('options') if isinstance(q, dict) else None
+            self.options[i] = len(options) if isinstance(options, list) else 0
+            correct = q.get('correct') if isinstance(q, dict) else None
+            as_int = _as_int(correct)
+            if as_int is not None:
+                self.key[i] = as_int
+                self.mask[i] = True
+            elif correct is not None:
+                self.generic.append((i, correct))
+
+    def encode(self, answers):
+        """Answers (list, or dict keyed by question index string) -> (int64 values, int mask, raw list)."""
+        if isinstance(answers, dict):
+            raw = [answers.get(str(i)) for i in range(self.total)]
+        elif isinstance(answers, list):
+            raw = answers[:self.total] + [None] * (self.total - len(answers))
+        else:
+            raw = [None] * self.total
+        values = np.zeros(self.total, dtype=np.int64)
+        answered = np.zeros(self.total, dtype=bool)
+        for i, answer in enumerate(raw):
+            as_int = _as_int(answer)
+            if as_int is not None:
+                values[i] = as_int
+                answered[i] = True
+        return values, answered, raw
+
+    def pack(self, answers):
+        """Answers as one int8 per question (option index, -1 = unanswered or not an option index)."""
+        values, answered, _ = self.encode(answers)
+        valid = answered & (values >= 0) & (values <= ANSWER_MAX)
+        return np.where(valid, values, -1).astype(np.int8).tobytes()
+
+    def score(self, answers):
+        values, answered, raw = self.encode(answers)
+        score = int(np.count_nonzero(self.mask & answered & (values == self.key)))
+        # Rare non-index keys, compared exactly as before
+        score += sum(1 for i, correct in self.generic if raw[i] is not None and raw[i] == correct)
+        return score
+
+
+_INT64 = np.iinfo(np.int64)
+ANSWER_MAX = np.iinfo(np.int8).max
+
+def _as_int(value):
+    # Values that compare equal to an int under Python ==: ints, bools, integral floats
+    if isinstance(value, (bool, int, np.integer)):
+        value = int(value)
+    elif isinstance(value, float) and value.is_integer():
+        value = int(value)
+    else:
+        return None
+    return value if _INT64.min <= value <= _INT64.max else None
+
+
+class QuizKeyCache:
+    """
+    In-process cache of compiled answer keys, so /quiz/submit never reads the
+    quiz's JSON body. invalidate() is called when a quiz is stopped or deleted;
+    other processes notice through a stamp file (one os.stat per lookup) and
+    drop their whole cache. `version` increases on every invalidation and is
+    stored on each compiled key.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = {}
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._stamp = ChangeStamp()
+        self._stamp_seen = None
+
+    def init_app(self, app):
+        self._stamp.init(app.config.get('QUIZ_STAMP_FILE') or os.path.join(app.instance_path, 'quiz.stamp'))
+        self._stamp_seen = self._stamp.read()
+
+    def get(self, quiz_id):
+        """Return the AnswerKey for a quiz, or None if it does not exist. Needs an app context on a miss."""
+        try:
+            quiz_id = int(quiz_id)  # JSON clients may send "12"
+        except (TypeError, ValueError):
+            return None
+        stamp = self._stamp.read()
+        with self._lock:
+            if stamp != self._stamp_seen:
+                self._keys.clear()
+                self.version += 1
+                self._stamp_seen = stamp
+            key = self._keys.get(quiz_id)
+        if key is not None:
+            self.hits += 1
+            return key
+
+        from models import Quiz
+
+        self.misses += 1
+        quiz = Quiz.query.get(quiz_id)
+        if quiz is None:
+            return None
+        with self._lock:
+            key = AnswerKey(quiz.id, quiz.questions or [], self.version)
+            self._keys[quiz.id] = key
+        return key
+
+    def invalidate(self, quiz_id):
+        with self._lock:
+            self._keys.pop(quiz_id, None)
+            self.version += 1
+            self._stamp_seen = self._stamp.touch(self.version)
+
+
+quiz_keys = QuizKeyCache()
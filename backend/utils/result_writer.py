@@ -0,0 +1,250 @@
+import atexit
+import threading
+import time
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from utils.db_engine import upsert_for
+
+STORED = "stored"        # Row inserted
+DUPLICATE = "duplicate"  # The unique (quiz_id, student_id) index already had a row, e.g. from another process
+REJECTED = "rejected"    # Any other constraint failed (quiz deleted meanwhile, unknown student)
+DROPPED = "dropped"      # Discarded by forget_quiz() before it was written
+
+
+class PendingResult:
+    """One queued row; `outcome` is set (and `done` signalled) once its batch has been written."""
+    __slots__ = ("row", "done", "outcome")
+
+    def __init__(self, row):
+        self.row = row
+        self.done = threading.Event()
+        self.outcome = None
+
+    def resolve(self, outcome):
+        self.outcome = outcome
+        self.done.set()
+
+
+class QuizResultWriter:
+    """
+    Group commit for QuizResult rows.
+
+    /quiz/submit scores the answers, claims (quiz, student) in an in-memory
+    set and hands the row to submit(), which waits until a background thread
+    has written it: queued rows from all concurrent requests go out as one
+    multi-row INSERT ... ON CONFLICT DO NOTHING RETURNING every `interval_ms`
+    or as soon as `max_rows` are waiting. RETURNING tells each request whether
+    its own row was stored, so the unique (quiz_id, student_id) index is the
+    final word on duplicates across processes and the response always agrees
+    with the database. Rows still queued are flushed at interpreter exit.
+    """
+
+    def __init__(self, interval_ms=50, max_rows=200, timeout_s=10, enabled=True):
+        self.interval_ms = interval_ms
+        self.max_rows = max_rows
+        self.timeout_s = timeout_s
+        self.enabled = enabled
+        self.app = None
+        self._cond = threading.Condition()
+        self._buffer = []  # PendingResult
+        self._flush_lock = threading.Lock()  # Held for the whole write of a batch
+        self._submitted = {}  # quiz id -> student ids with a stored or queued result
+        self._thread = None
+        self._stopped = False
+        self.rows_written = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.flushes = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.interval_ms = app.config.get('QUIZ_FLUSH_INTERVAL_MS', self.interval_ms)
+        self.max_rows = app.config.get('QUIZ_FLUSH_MAX_ROWS', self.max_rows)
+        self.timeout_s = app.config.get('QUIZ_FLUSH_TIMEOUT_S', self.timeout_s)
+        self.enabled = app.config.get('QUIZ_WRITE_BEHIND', self.enabled)
+        atexit.register(self.shutdown)
+
+    # -------------------------
+    # Duplicate tracking
+    # -------------------------
+
+    def claim(self, quiz_id, student_id):
+        """
+        Reserve a student's one submission for a quiz. False if this process
+        already knows of one; submissions made through other processes are
+        caught by submit(). Needs an app context.
+        """
+        submitted = self._submitted.get(quiz_id)
+        if submitted is None:
+            submitted = self._load_submitted(quiz_id)
+        with self._cond:
+            if student_id in submitted:
+                return False
+            submitted.add(student_id)
+            return True
+
+    def release(self, quiz_id, student_id):
+        """Undo claim() for a submission that was not stored."""
+        with self._cond:
+            self._submitted.get(quiz_id, set()).discard(student_id)
+
+    def _load_submitted(self, quiz_id):
+        from models import QuizResult
+
+        stored = {sid for (sid,) in db.session.query(QuizResult.student_id).filter_by(quiz_id=quiz_id)}
+        with self._cond:
+            # Rows still in the buffer are not in the DB yet
+            stored.update(p.row["student_id"] for p in self._buffer if p.row["quiz_id"] == quiz_id)
+            return self._submitted.setdefault(quiz_id, stored)
+
+    def forget_quiz(self, quiz_id):
+        """
+        Drop queued rows and the submitted set, e.g. when a quiz is deleted.
+        Waits for a batch that is being written, so the caller's DELETE sees its rows.
+        """
+        with self._flush_lock:
+            with self._cond:
+                dropped = [p for p in self._buffer if p.row["quiz_id"] == quiz_id]
+                self._buffer = [p for p in self._buffer if p.row["quiz_id"] != quiz_id]
+                self._submitted.pop(quiz_id, None)
+        for pending in dropped:
+            pending.resolve(DROPPED)
+
+    # -------------------------
+    # Buffering
+    # -------------------------
+
+    def submit(self, row):
+        """
+        Queue a QuizResult row (dict of column values) and wait for its batch.
+        Returns its outcome (STORED, DUPLICATE, REJECTED or DROPPED). Raises
+        TimeoutError if it could not be written within `timeout_s`; the row is
+        then withdrawn, so it will not appear later.
+        """
+        pending = PendingResult(row)
+        if not self.enabled:
+            with self._flush_lock:
+                self._write([pending])
+            return pending.outcome
+
+        self._ensure_started()
+        with self._cond:
+            self._buffer.append(pending)
+            if len(self._buffer) >= self.max_rows:
+                self._cond.notify()
+        while not pending.done.wait(self.timeout_s):
+            with self._cond:
+                if pending in self._buffer:
+                    self._buffer.remove(pending)
+                    raise TimeoutError("Quiz result could not be written in time")
+            # Otherwise its batch is being written right now; wait for that
+        return pending.outcome
+
+    def pending(self):
+        return len(self._buffer)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="quiz-result-writer", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while not self._stopped:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or len(self._buffer) >= self.max_rows, self.interval_ms / 1000.0)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[QUIZ] Flush failed, will retry: {e}")
+                time.sleep(self.interval_ms / 1000.0)
+
+    def flush(self):
+        """Write everything queued so far. Safe to call from request handlers (read-your-writes)."""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+            try:
+                self._write(batch)
+            except Exception:
+                with self._cond:
+                    self._buffer = batch + self._buffer  # Keep them for the next attempt
+                raise
+            return len(batch)
+
+    def _write(self, batch):
+        """Insert a batch and resolve each PendingResult with its outcome. Caller holds _flush_lock."""
+        from models import QuizResult
+
+        with self.app.app_context():
+            engine = db.engine
+            table = QuizResult.__table__
+            upsert = upsert_for(engine.dialect)
+            if upsert is None:
+                outcomes = self._write_rows(engine, table, None, batch)
+            else:
+                try:
+                    with engine.begin() as conn:
+                        stmt = upsert(table).on_conflict_do_nothing(index_elements=["quiz_id", "student_id"]) \
+                            .returning(table.c.quiz_id, table.c.student_id)
+                        inserted = set(conn.execute(stmt, [p.row for p in batch]).tuples())
+                    outcomes = [STORED if (p.row["quiz_id"], p.row["student_id"]) in inserted else DUPLICATE for p in batch]
+                except IntegrityError:
+                    # A row broke another constraint (e.g. its quiz was deleted); don't let it fail the others
+                    outcomes = self._write_rows(engine, table, upsert, batch)
+
+        with self._cond:
+            self.flushes += 1
+            self.rows_written += outcomes.count(STORED)
+            self.duplicates += outcomes.count(DUPLICATE)
+            self.rejected += outcomes.count(REJECTED)
+        for pending, outcome in zip(batch, outcomes):
+            pending.resolve(outcome)
+
+    def _write_rows(self, engine, table, upsert, batch):
+        outcomes = []
+        with engine.begin() as conn:
+            for pending in batch:
+                try:
+                    with conn.begin_nested():
+                        if upsert is not None:
+                            stmt = upsert(table).on_conflict_do_nothing(index_elements=["quiz_id", "student_id"])
+                            stored = conn.execute(stmt, pending.row).rowcount == 1
+                            outcomes.append(STORED if stored else DUPLICATE)
+                        else:
+                            conn.execute(table.insert(), pending.row)
+                            outcomes.append(STORED)
+                except IntegrityError:
+                    # Without ON CONFLICT a duplicate also lands here
+                    outcomes.append(REJECTED if upsert is not None else DUPLICATE)
+        return outcomes
+
+    def shutdown(self):
+        """Stop the background thread and write whatever is still queued."""
+        self._stopped = True
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        try:
+            flushed = self.flush()
+            if flushed:
+                print(f"[QUIZ] Flushed {flushed} pending results on shutdown")
+        except Exception as e:
+            print(f"[QUIZ] Could not flush pending results on shutdown: {e}")
+
+    def stats(self):
+        return {
+            "pending": self.pending(),
+            "rows_written": self.rows_written,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "flushes": self.flushes
+        }
+
+
+quiz_results_writer = QuizResultWriter()
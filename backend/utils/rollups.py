@@ -0,0 +1,93 @@
+"""
+Attendance rollups: per (student, subject) Present/Late/Absent counts.
+
+apply_attendance() runs inside the caller's transaction, next to the
+Attendance insert or correction it mirrors, so the rollup and the raw rows
+commit or roll back together. rebuild() recomputes everything from the
+attendance table (backfills, imports, or after editing rows by hand); run
+it with `python rebuild_rollups.py`.
+"""
+from sqlalchemy import case, delete, func, insert, select
+from extensions import db
+from utils.db_engine import upsert_for
+from models import Attendance, AttendanceRollup, Lecture
+
+STATUS_COLUMNS = {"Present": "present", "Late": "late", "Absent": "absent"}
+SEEN_STATUSES = ("Present", "Late")
+
+
+def apply_attendance(student_id, subject, status, timestamp, delta=1):
+    """Add (delta=1) or remove (delta=-1) one attendance row from the rollup. Does not commit."""
+    column = STATUS_COLUMNS.get(status or "Present")
+    if column is None or subject is None:
+        return
+    seen = timestamp if delta > 0 and status in SEEN_STATUSES else None
+    table = AttendanceRollup.__table__
+
+    upsert = upsert_for(db.session.get_bind().dialect)
+    if upsert is None:
+        _apply_orm(student_id, subject, column, seen, delta)
+        return
+
+    values = {"student_id": student_id, "subject": subject, "present": 0, "late": 0, "absent": 0, "last_seen": seen}
+    values[column] = max(delta, 0)
+    stmt = upsert(table).values(**values)
+    updates = {column: table.c[column] + delta}
+    if seen is not None:
+        updates["last_seen"] = case(
+            (db.or_(table.c.last_seen.is_(None), table.c.last_seen < seen), seen),
+            else_=table.c.last_seen
+        )
+    db.session.execute(stmt.on_conflict_do_update(index_elements=["student_id", "subject"], set_=updates))
+
+
+def _apply_orm(student_id, subject, column, seen, delta):
+    # Databases without INSERT ... ON CONFLICT: read-modify-write under the row's transaction
+    rollup = db.session.get(AttendanceRollup, (student_id, subject), with_for_update=True)
+    if rollup is None:
+        rollup = AttendanceRollup(student_id=student_id, subject=subject, present=0, late=0, absent=0)
+        db.session.add(rollup)
+    setattr(rollup, column, max(getattr(rollup, column) + delta, 0))
+    if seen is not None and (rollup.last_seen is None or rollup.last_seen < seen):
+        rollup.last_seen = seen
+
+
+def refresh_last_seen(student_id, subject):
+    """Recompute last_seen after a row stopped counting as seen (e.g. corrected to Absent)."""
+    latest = select(func.max(Attendance.timestamp)) \
+        .join(Lecture, Lecture.id == Attendance.lecture_id) \
+        .where(Attendance.student_id == student_id, Lecture.subject == subject, Attendance.status.in_(SEEN_STATUSES)) \
+        .scalar_subquery()
+    db.session.execute(
+        AttendanceRollup.__table__.update()
+        .where(AttendanceRollup.student_id == student_id, AttendanceRollup.subject == subject)
+        .values(last_seen=latest)
+    )
+
+
+def rebuild_statements():
+    """DELETE + INSERT ... SELECT that recompute every rollup from attendance."""
+    status = func.coalesce(Attendance.status, "Present")
+    aggregate = select(
+        Attendance.student_id,
+        Lecture.subject,
+        func.sum(case((status == "Present", 1), else_=0)),
+        func.sum(case((status == "Late", 1), else_=0)),
+        func.sum(case((status == "Absent", 1), else_=0)),
+        func.max(case((status.in_(SEEN_STATUSES), Attendance.timestamp)))
+    ).join(Lecture, Lecture.id == Attendance.lecture_id) \
+        .group_by(Attendance.student_id, Lecture.subject)
+
+    table = AttendanceRollup.__table__
+    return [
+        delete(table),
+        insert(table).from_select(["student_id", "subject", "present", "late", "absent", "last_seen"], aggregate)
+    ]
+
+
+def rebuild():
+    """Replace all rollups in one transaction. Returns the number of rollup rows."""
+    for stmt in rebuild_statements():
+        db.session.execute(stmt)
+    db.session.commit()
+    return db.session.query(AttendanceRollup).count()
@@ -0,0 +1,116 @@
+import os
+import threading
+from collections import namedtuple
+
+# Detached copy of the active Lecture row, safe to share between requests
+ActiveLecture = namedtuple('ActiveLecture', ['id', 'subject', 'teacher_id', 'start_time'])
+
+
+class ChangeStamp:
+    """
+    A file whose mtime tells other processes that some cached state changed.
+    Reading it costs one os.stat; writers rewrite it after each change.
+    """
+
+    def __init__(self, path=None):
+        self.path = None
+        if path:
+            self.init(path)
+
+    def init(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def read(self):
+        if not self.path:
+            return None
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
+
+    def touch(self, version=0):
+        if not self.path:
+            return None
+        with open(self.path, 'w') as f:
+            f.write(f"{os.getpid()} {version}\n")
+        return self.read()
+
+
+class ActiveSessionCache:
+    """
+    In-process cache of the currently active lecture.
+
+    The value changes only when a class starts or ends, so it is read from
+    the DB once and then updated by toggle_class_status via set().
+    Other processes are told about changes through a stamp file whose
+    mtime is checked (one os.stat) on every read; extra hooks, e.g. a
+    pub/sub publisher, can be registered with add_listener().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lecture = None
+        self._loaded = False
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._listeners = []
+        self._stamp = ChangeStamp()
+        self._stamp_seen = None
+        self.app = None
+
+    def init_app(self, app):
+        self.app = app
+        self._stamp.init(app.config.get('ACTIVE_SESSION_STAMP_FILE') or os.path.join(app.instance_path, 'active_session.stamp'))
+
+    def get(self):
+        """Return the ActiveLecture or None. Needs an app context on a cache miss."""
+        stamp = self._stamp.read()
+        if self._loaded and stamp == self._stamp_seen:
+            self.hits += 1
+            return self._lecture
+
+        from models import Lecture
+
+        self.misses += 1
+        lecture = Lecture.query.filter_by(is_active=True).first()
+        with self._lock:
+            self._lecture = self._snapshot(lecture)
+            self._loaded = True
+            self._stamp_seen = stamp
+            self.version += 1
+        return self._lecture
+
+    def set(self, lecture):
+        """Record a class start (a Lecture) or end (None) made by this process."""
+        with self._lock:
+            self._lecture = self._snapshot(lecture)
+            self._loaded = True
+            self.version += 1
+            self._stamp_seen = self._stamp.touch(self.version)
+            snapshot, version = self._lecture, self.version
+        for listener in self._listeners:
+            try:
+                listener(version, snapshot)
+            except Exception as e:
+                print(f"[SESSION] Listener error: {e}")
+
+    def invalidate(self):
+        """Force the next get() to reload from the DB (e.g. on a message from another process)."""
+        with self._lock:
+            self._loaded = False
+
+    def add_listener(self, fn):
+        """fn(version, ActiveLecture or None) is called after every local change."""
+        self._listeners.append(fn)
+
+    @staticmethod
+    def _snapshot(lecture):
+        if lecture is None:
+            return None
+        return ActiveLecture(lecture.id, lecture.subject, lecture.teacher_id, lecture.start_time)
+
+
+active_session = ActiveSessionCache()
@@ -32,8 +32,16 @@ export default function Attendance() {
         };
 
         checkClassStatus();
-        const interval = setInterval(checkClassStatus, 5000);
-        return () => clearInterval(interval);
+        // Class start/end is pushed over Server-Sent Events instead of polling every 5s
+        const events = new EventSource(`${API_BASE_URL}/events/stream?topics=class_started,class_ended`);
+        events.addEventListener("snapshot", (e) => setActiveClass(JSON.parse(e.data).active_class));
+        events.addEventListener("class_started", (e) => setActiveClass(JSON.parse(e.data).subject));
+        events.addEventListener("class_ended", () => setActiveClass(null));
+        const interval = setInterval(checkClassStatus, 60000);
+        return () => {
+            events.close();
+            clearInterval(interval);
+        };
     }, []);
 
     // Load Face API Models
@@ -139,23 +147,26 @@ export default function Attendance() {
         setResult(null);
         setError("");
 
-        // Compress image
-        const imageSrc = webcamRef.current.getScreenshot({ width: 640, height: 480 });
-
         const url = `${API_BASE_URL}/attendance/mark`;
         console.log("Sending request to:", url);
 
         try {
+            // Compress image and upload it as a binary JPEG part (no base64 inflation)
+            const canvas = webcamRef.current.getCanvas({ width: 640, height: 480 });
+            const imageBlob = await new Promise((resolve) => canvas.toBlob(resolve, "image/jpeg", 0.92));
+
+            const form = new FormData();
+            form.append("student_id", user.id);
+            form.append("image", imageBlob, "capture.jpg");
+            if (location) {
+                form.append("latitude", location.lat);
+                form.append("longitude", location.lon);
+            }
+            if (activeClass) form.append("subject", activeClass);
+
             const res = await fetch(url, {
                 method: "POST",
-                headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({
-                    student_id: user.id,
-                    image: imageSrc,
-                    latitude: location?.lat,
-                    longitude: location?.lon,
-                    subject: activeClass
-                }),
+                body: form,
             });
 
             const data = await res.json();
@@ -17,8 +17,27 @@ export default function TeacherDashboard() {
 
     useEffect(() => {
         fetchStats();
-        const interval = setInterval(fetchStats, 5000); // Poll every 5s
-        return () => clearInterval(interval);
+        // Live updates pushed by the server instead of polling every 5s
+        // Counts come with each event, so a check-in burst causes no extra requests
+        const events = new EventSource(`${API_BASE_URL}/events/stream?topics=class_started,class_ended,attendance`);
+        events.addEventListener("snapshot", (e) => setStats(JSON.parse(e.data)));
+        events.addEventListener("class_started", (e) => {
+            const data = JSON.parse(e.data);
+            setStats((prev) => ({ ...prev, active_class: data.subject, active_lecture_id: data.lecture_id }));
+        });
+        events.addEventListener("class_ended", () =>
+            setStats((prev) => ({ ...prev, active_class: null, active_lecture_id: null }))
+        );
+        events.addEventListener("attendance", (e) => {
+            const data = JSON.parse(e.data);
+            setStats((prev) => ({ ...prev, total_attendance: data.total_attendance }));
+        });
+        // Slow safety net in case the stream is blocked by a proxy
+        const interval = setInterval(fetchStats, 60000);
+        return () => {
+            events.close();
+            clearInterval(interval);
+        };
     }, []);
 
     const toggleClass = async () => {
@@ -1,7 +1,20 @@
-import React from "react";
-import { Camera, UserCheck, UserX } from "lucide-react";
+import React, { useEffect, useState } from "react";
+import { Camera, UserCheck, Clock } from "lucide-react";
+import { API_BASE_URL } from "../../config";
 
 export default function Monitor() {
+    const [scans, setScans] = useState([]);
+
+    // Live feed of check-ins pushed by the server
+    useEffect(() => {
+        const events = new EventSource(`${API_BASE_URL}/events/stream?topics=attendance`);
+        events.addEventListener("attendance", (e) => {
+            const record = JSON.parse(e.data);
+            setScans((prev) => [record, ...prev].slice(0, 20));
+        });
+        return () => events.close();
+    }, []);
+
     return (
         <div className="space-y-6">
             <div>
@@ -33,17 +46,20 @@ export default function Monitor() {
                         Recent Scans
                     </h2>
                     <div className="space-y-4">
-                        {[1, 2, 3, 4].map((i) => (
-                            <div key={i} className="flex items-center gap-3 p-3 rounded-xl bg-slate-50 dark:bg-slate-800/50 border border-slate-100 dark:border-slate-800">
+                        {scans.length === 0 && (
+                            <p className="text-sm text-slate-500">No check-ins yet.</p>
+                        )}
+                        {scans.map((scan) => (
+                            <div key={scan.id} className="flex items-center gap-3 p-3 rounded-xl bg-slate-50 dark:bg-slate-800/50 border border-slate-100 dark:border-slate-800">
                                 <div className="w-10 h-10 rounded-full bg-slate-200 dark:bg-slate-700 overflow-hidden">
                                     {/* Placeholder for face image */}
                                 </div>
                                 <div className="flex-1">
-                                    <p className="text-sm font-medium text-slate-900 dark:text-white">Student {i}</p>
-                                    <p className="text-xs text-slate-500">10:0{i} AM</p>
+                                    <p className="text-sm font-medium text-slate-900 dark:text-white">{scan.student_name || scan.student_id}</p>
+                                    <p className="text-xs text-slate-500">{new Date(scan.timestamp + "Z").toLocaleTimeString()}</p>
                                 </div>
-                                {i % 3 === 0 ? (
-                                    <UserX size={20} className="text-red-500" />
+                                {scan.status === "Late" ? (
+                                    <Clock size={20} className="text-amber-500" />
                                 ) : (
                                     <UserCheck size={20} className="text-emerald-500" />
                                 )}